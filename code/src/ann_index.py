@@ -0,0 +1,108 @@
+# ann_index.py - FAISS index factory for email embedding search
+import math
+
+import faiss
+import numpy as np
+
+from config import ANN_INDEX_PARAMS
+
+INDEX_KINDS = ("flat", "ivfpq", "hnsw")
+
+
+def get_params(params=None):
+    """Return the default index parameters overridden by `params`"""
+    merged = dict(ANN_INDEX_PARAMS)
+    merged.update(params or {})
+    return merged
+
+
+def normalize(vectors):
+    """Return float32 copies of the vectors scaled to unit length (for cosine similarity)"""
+    vectors = np.array(vectors, dtype="float32", ndmin=2)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def min_training_size(kind, params=None):
+    """Number of vectors needed before an index of this kind can be built"""
+    if kind == "ivfpq":
+        params = get_params(params)
+        # PQ training needs at least one point per centroid of each sub-quantiser
+        return max(params["min_train_size"], 2 ** params["pq_bits"])
+    return 0
+
+
+def is_approximate(kind):
+    """True if the index scores are estimates (PQ codes) that need exact re-ranking before thresholding"""
+    return kind == "ivfpq"
+
+
+def make_index(kind, dimension, ntotal=0, params=None):
+    """Create an empty inner-product index that accepts add_with_ids.
+
+    On unit vectors inner product equals cosine similarity. `ntotal` is the
+    expected corpus size, used to size the IVF coarse quantiser.
+    """
+    params = get_params(params)
+    if kind == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["ef_construction"]
+        return faiss.IndexIDMap2(index)
+    if kind == "ivfpq":
+        # Rule of thumb: ~4*sqrt(n) lists, each trained on at least 39 points
+        nlist = max(1, min(params["nlist"], int(4 * math.sqrt(max(ntotal, 1))), max(ntotal, 1) // 39))
+        quantizer = faiss.IndexFlatIP(dimension)
+        return faiss.IndexIVFPQ(quantizer, dimension, nlist, params["pq_m"], params["pq_bits"], faiss.METRIC_INNER_PRODUCT)
+    raise ValueError(f"Unknown index kind: {kind} (expected one of {', '.join(INDEX_KINDS)})")
+
+
+def train_index(index, vectors, params=None):
+    """Train the index on a random sample of the vectors if it needs training"""
+    if index.is_trained:
+        return
+    params = get_params(params)
+    sample_size = min(len(vectors), params["train_sample"])
+    rows = np.sort(np.random.default_rng(0).choice(len(vectors), sample_size, replace=False))
+    index.train(np.ascontiguousarray(vectors[rows], dtype="float32"))
+
+
+def configure_search(index, kind, params=None):
+    """Apply query-time parameters, which FAISS does not persist with the index"""
+    params = get_params(params)
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if kind == "ivfpq":
+        faiss.extract_index_ivf(inner).nprobe = params["nprobe"]
+    elif kind == "hnsw":
+        inner.hnsw.efSearch = params["ef_search"]
+    return index
+
+
+def search_reranked(index, query, k, lookup, params=None):
+    """Search for rerank_candidates approximate hits, then keep the k best by exact inner product.
+
+    lookup(ids) returns the stored (normalised) vectors of an array of ids.
+    Returns (scores, ids) as 1-d arrays, best first.
+    """
+    candidates = max(k, get_params(params)["rerank_candidates"])
+    _, ids = index.search(query.reshape(1, -1), min(candidates, index.ntotal))
+    ids = ids[0][ids[0] >= 0]
+    if not len(ids):
+        return np.zeros(0, dtype="float32"), ids
+    scores = lookup(ids) @ query.reshape(-1)
+    best = np.argsort(-scores)[:k]
+    return scores[best], ids[best]
+
+
+def build_index(kind, vectors, ids, params=None, chunk_size=100000):
+    """Build a trained, populated index from (already normalised) vectors and their ids"""
+    index = make_index(kind, vectors.shape[1], len(vectors), params)
+    train_index(index, vectors, params)
+    # Add in chunks so a memory-mapped vector file is never fully copied into RAM
+    for start in range(0, len(vectors), chunk_size):
+        index.add_with_ids(
+            np.ascontiguousarray(vectors[start:start + chunk_size], dtype="float32"),
+            np.ascontiguousarray(ids[start:start + chunk_size], dtype="int64"),
+        )
+    return configure_search(index, kind, params)
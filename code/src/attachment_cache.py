@@ -0,0 +1,79 @@
+# attachment_cache.py - On-disk cache of extracted attachment text, keyed by file content
+import hashlib
+import os
+import threading
+
+from config import ATTACHMENT_CACHE_DIR, ATTACHMENT_CACHE_MAX_BYTES, EXTRACTION_CHAR_BUDGET
+from extractor import EXTRACTOR_VERSION
+
+_lock = threading.Lock()
+_total_bytes = None  # Size of the cache directory, scanned on first write
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_path(digest, cache_dir):
+    # Extractor version and budget are part of the name so changing either invalidates old text
+    return os.path.join(cache_dir, f"{digest}-v{EXTRACTOR_VERSION}-b{EXTRACTION_CHAR_BUDGET}.txt")
+
+
+def get_cached_text(digest, cache_dir=ATTACHMENT_CACHE_DIR):
+    """Return the cached text for a content digest, or None"""
+    path = _cache_path(digest, cache_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+    # Touch the entry so eviction drops the least recently used files first
+    os.utime(path)
+    return text
+
+
+def put_cached_text(digest, text, cache_dir=ATTACHMENT_CACHE_DIR, max_bytes=ATTACHMENT_CACHE_MAX_BYTES):
+    """Store extracted text and evict old entries beyond max_bytes"""
+    global _total_bytes
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _cache_path(digest, cache_dir)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    size = os.path.getsize(tmp_path)
+    os.replace(tmp_path, path)
+
+    with _lock:
+        if _total_bytes is None:
+            _total_bytes = _directory_size(cache_dir)
+        else:
+            _total_bytes += size
+        if _total_bytes > max_bytes:
+            _total_bytes = _evict(cache_dir, int(max_bytes * 0.9))
+
+
+def _directory_size(cache_dir):
+    return sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.is_file())
+
+
+def _evict(cache_dir, target_bytes):
+    """Delete least recently used entries until the cache fits in target_bytes; returns the new size"""
+    entries = sorted(
+        (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+        for entry in os.scandir(cache_dir) if entry.is_file()
+    )
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= target_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+    return total
@@ -0,0 +1,87 @@
+# bench_ann.py - Recall and latency of the ANN index kinds against exact (Flat) search
+#
+# Usage: python bench_ann.py [--sizes 10000,100000,1000000] [--queries 1000] [--k 10]
+import argparse
+import time
+
+import numpy as np
+
+from ann_index import INDEX_KINDS, build_index, is_approximate, normalize, search_reranked
+from config import EMBEDDING_DIMENSION
+
+
+def synthetic_corpus(size, dimension, clusters=256, seed=0):
+    """Unit vectors drawn around random centres, roughly like topic-clustered email embeddings"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimension)).astype("float32")
+    vectors = np.empty((size, dimension), dtype="float32")
+    for start in range(0, size, 100000):
+        stop = min(size, start + 100000)
+        assignment = rng.integers(0, clusters, stop - start)
+        vectors[start:stop] = centres[assignment] + 0.6 * rng.standard_normal((stop - start, dimension))
+    return normalize(vectors)
+
+
+def make_queries(corpus, count, seed=1):
+    """Perturbed copies of corpus vectors, like re-sent or lightly edited emails"""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(corpus), count)
+    return normalize(corpus[picks] + 0.05 * rng.standard_normal((count, corpus.shape[1])))
+
+
+def measure(search, queries, k):
+    """Return (ids of the top k per query, per-query latencies in ms) calling search(query) one query at a time"""
+    found = np.full((len(queries), k), -1, dtype="int64")
+    latencies = np.empty(len(queries))
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        ids = search(query)
+        latencies[i] = (time.perf_counter() - started) * 1000
+        found[i, :len(ids)] = ids
+    return found, latencies
+
+
+def recall_at_k(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ANN index kinds against exact search")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated corpus sizes")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--kinds", default=",".join(INDEX_KINDS))
+    parser.add_argument("--dimension", type=int, default=EMBEDDING_DIMENSION)
+    args = parser.parse_args()
+
+    kinds = args.kinds.split(",")
+    print(f"{'size':>9} {'index':>8} {'build s':>8} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        corpus = synthetic_corpus(size, args.dimension)
+        ids = np.arange(size, dtype="int64")
+        queries = make_queries(corpus, args.queries)
+
+        truth = None
+        for kind in ["flat"] + [kind for kind in kinds if kind != "flat"]:
+            started = time.perf_counter()
+            # min_train_size=0 so IVF-PQ is measured even on the smallest corpus
+            index = build_index(kind, corpus, ids, params={"min_train_size": 0})
+            build_seconds = time.perf_counter() - started
+
+            runs = [(kind, lambda query: index.search(query.reshape(1, -1), args.k)[1][0])]
+            if is_approximate(kind):
+                # What VectorStore.search does: exact re-ranking of the candidates
+                runs.append((kind + "+rr", lambda query: search_reranked(index, query, args.k, corpus.__getitem__)[1]))
+            for name, search in runs:
+                found, latencies = measure(search, queries, args.k)
+                if truth is None:
+                    truth = found
+                print(
+                    f"{size:>9} {name:>8} {build_seconds:>8.1f} {recall_at_k(found, truth):>10.3f} "
+                    f"{np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 99):>8.3f}"
+                )
+            del index
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# bench_extract.py - Peak RSS and time of spreadsheet extraction: pandas to_string vs streaming TSV
+#
+# Usage: python bench_extract.py [--rows 100000] [--sheets 3] [--file schedule.xlsx]
+# Each variant runs in a fresh interpreter so its peak RSS is measured in isolation.
+import argparse
+import datetime
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def make_workbook(path, rows, sheets):
+    """Write a payment-schedule-like workbook with write-only (streaming) openpyxl"""
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    start = datetime.datetime(2025, 2, 4)
+    for s in range(sheets):
+        sheet = workbook.create_sheet(f"Schedule {s + 1}")
+        sheet.append(["Payment Date", "Facility", "Principal", "Interest", "Fee", "Currency", "Reference", "Borrower"])
+        for i in range(rows):
+            sheet.append([
+                start + datetime.timedelta(days=i % 3650), "TERM LOAN A-2", 5518249.19 + i, 1234.5 + i % 97,
+                171.3, "USD", f"TXN-{s}-{i:07d}", "ATLANTIC LLC",
+            ])
+    workbook.save(path)
+
+
+def run_variant(variant, path):
+    """Child process: extract with one variant and report time, peak RSS and output size"""
+    started = time.perf_counter()
+    if variant == "pandas":
+        # The previous implementation
+        import pandas as pd
+        df = pd.read_excel(path, sheet_name=None)
+        text = "\n".join(df[sheet].to_string() for sheet in df)
+    else:
+        from extractor import iter_text_chunks
+        text = "\n".join(iter_text_chunks(path, char_budget=None if variant == "streaming" else int(variant)))
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    print(json.dumps({"variant": variant, "seconds": elapsed, "peak_rss_mb": peak_mb, "chars": len(text)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare spreadsheet extraction paths")
+    parser.add_argument("--rows", type=int, default=100000, help="rows per sheet in the generated workbook")
+    parser.add_argument("--sheets", type=int, default=3)
+    parser.add_argument("--file", help="benchmark an existing .xlsx instead of a generated one")
+    parser.add_argument("--budget", type=int, default=32000, help="character budget for the budgeted streaming run")
+    parser.add_argument("--run", nargs=2, metavar=("VARIANT", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_variant(*args.run)
+        return
+
+    path = args.file
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(), "schedule.xlsx")
+        make_workbook(path, args.rows, args.sheets)
+    print(f"{path}: {os.path.getsize(path) / (1024 * 1024):.1f} MB")
+
+    print(f"{'variant':>16} {'seconds':>8} {'peak RSS MB':>12} {'chars':>12}")
+    for variant in ("pandas", "streaming", str(args.budget)):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run", variant, path],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        label = result["variant"] if not result["variant"].isdigit() else f"budget {result['variant']}"
+        print(f"{label:>16} {result['seconds']:>8.2f} {result['peak_rss_mb']:>12.1f} {result['chars']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# bench_startup.py - Cold import time of the app's modules, from `python -X importtime`
+#
+# Usage: python bench_startup.py [--modules crew extractor worker] [--top 10] [--repeat 3]
+# Each module is imported in a fresh interpreter; run it before and after a change
+# to check that cold start (and the Streamlit rerun path) got faster.
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+DEFAULT_MODULES = ["main_deps", "worker", "pipeline", "crew", "extractor", "extraction_pool", "vector_store"]
+# Everything main.py imports at the top, without executing the Streamlit script itself
+MAIN_DEPS = "import state_store, job_queue, worker, scheduler, ui_styles"
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def import_statement(module):
+    return MAIN_DEPS if module == "main_deps" else f"import {module}"
+
+
+def measure(module):
+    """Import module in a fresh interpreter; returns (wall seconds, [(cumulative us, self us, depth, name)])"""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", import_statement(module)],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((int(cumulative_us), int(self_us), len(indent) // 2, name))
+    return elapsed, entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report cold import time per module")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES,
+                        help="modules to import (main_deps = the imports at the top of main.py)")
+    parser.add_argument("--top", type=int, default=10, help="slowest direct dependencies to list per module")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per module; the fastest is reported")
+    args = parser.parse_args()
+
+    print(f"{'module':>16} {'wall ms':>9} {'import ms':>10} {'modules':>8}")
+    details = {}
+    for module in args.modules:
+        try:
+            runs = [measure(module) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{module:>16} failed: {e}")
+            continue
+        elapsed, entries = min(runs, key=lambda run: run[0])
+        total_us = sum(cumulative for cumulative, _, depth, _ in entries if depth == 0)
+        print(f"{module:>16} {elapsed * 1000:>9.0f} {total_us / 1000:>10.0f} {len(entries):>8}")
+        details[module] = entries
+
+    for module, entries in details.items():
+        print(f"\n{module}: slowest imports made by the imported modules")
+        children = sorted((entry for entry in entries if entry[2] == 1), reverse=True)[:args.top]
+        for cumulative, _, _, name in children:
+            print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,18 @@ import os
 # Constants
 CREDENTIALS_FILE = "../token.json"
 MAX_EMAILS_TO_FETCH = 50  # Increased from 5
+ATTACHMENTS_DIR = "../../venv/attachments"
+ATTACHMENT_CACHE_DIR = "../../venv/attachment_text_cache"  # Extracted text, keyed by file SHA-256
+ATTACHMENT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Attachment extraction settings
+EXTRACTION_WORKERS = os.cpu_count() or 2  # Extraction processes running at once
+EXTRACTION_TIMEOUT = 120  # Wall-clock seconds per file before the worker is killed
+EXTRACTION_MEMORY_LIMIT = 2 * 1024 * 1024 * 1024  # Address space per worker in bytes (POSIX only)
+EXTRACTION_TOKEN_BUDGET = 8000  # Stop reading an attachment after roughly this many tokens (None: no limit)
+CHARS_PER_TOKEN = 4  # Rough token size used to turn token budgets into character budgets
+EXTRACTION_CHAR_BUDGET = EXTRACTION_TOKEN_BUDGET * CHARS_PER_TOKEN if EXTRACTION_TOKEN_BUDGET else None
+OCR_RESOLUTION = 300  # DPI used to render scanned PDF pages for OCR
 
 # Request types dictionary
 REQUEST_TYPES = {
@@ -14,4 +26,155 @@ REQUEST_TYPES = {
     "Fee Payment": ["Ongoing Fee", "Letter of Credit Fee"],
     "Money Movement Inbound": ["Principal", "Interest", "Principal+Interest", "Principal+Interest+Fee"],
     "Money Movement Outbound": ["Timebound", "Foreign Currency"],
-}
\ No newline at end of file
+}
+
+# Pipeline settings
+PIPELINE_QUEUE_SIZE = 16  # Max items waiting between two stages
+PIPELINE_CONCURRENCY = {
+    "fetch": 4,     # Gmail API calls
+    "dedup": 2,     # Hashing the body and attachment files, indexed fingerprint lookups
+    "extract": 4,   # Emails whose attachments are being extracted (work runs in EXTRACTION_WORKERS processes)
+    "embed": 1,     # Embedding + FAISS duplicate lookup
+    "classify": 4,  # LLM crews
+}
+PIPELINE_BATCH_WAIT = 0.05  # Seconds a batching stage waits for more items to fill a batch
+
+# LLM settings
+CLASSIFIER_MODEL = "sambanova/Llama-3.1-Swallow-8B-Instruct-v0.3"
+EXTRACTOR_MODEL = "groq/llama3-8b-8192"
+CREW_PARALLEL = True  # Run the classification/extraction(/duplicate) crews concurrently
+CREW_MAX_WORKERS = 12  # Threads shared by all in-flight crew kickoffs
+ENABLE_DUPLICATE_CREW = False  # Ask the LLM to confirm vector-search duplicate hits
+PROVIDER_TIMEOUTS = {  # Seconds to wait for one crew kickoff, per LLM provider
+    "sambanova": 60,
+    "groq": 60,
+}
+DEFAULT_PROVIDER_TIMEOUT = 90
+MODEL_TOKEN_BUDGETS = {  # Tokens of email text per prompt, leaving room for the task template and the answer
+    CLASSIFIER_MODEL: 6000,
+    EXTRACTOR_MODEL: 6000,  # 8k context
+}
+DEFAULT_TOKEN_BUDGET = 6000
+MODEL_TOKEN_ENCODINGS = {  # tiktoken encoding per model that tiktoken does not know by name
+    CLASSIFIER_MODEL: "cl100k_base",  # Llama 3's vocabulary extends cl100k_base, so counts run slightly high
+    EXTRACTOR_MODEL: "cl100k_base",
+}
+DEFAULT_TOKEN_ENCODING = "cl100k_base"
+APPROXIMATE_TOKEN_MARGIN = 0.9  # Fraction of the budget used when a model's tokens can only be approximated
+DATE_DAY_FIRST = False  # Read ambiguous numeric dates like 11-4-2022 as month-day (US); True for day-month
+FAST_PATH_ENABLED = True  # Answer high-confidence emails with the local rule + centroid classifier
+FAST_PATH_THRESHOLD = 0.85  # Minimum combined confidence to skip the classification crew
+FAST_PATH_TEMPERATURE = 0.05  # Softmax temperature over centroid cosine similarities
+FAST_PATH_RULES = [  # Extra regex rules on top of the REQUEST_TYPES names
+    {"pattern": r"letter of credit (fee|charge)", "request_type": "Fee Payment", "sub_request_type": "Letter of Credit Fee"},
+    {"pattern": r"(ongoing|commitment|facility|ticking) fee", "request_type": "Fee Payment", "sub_request_type": "Ongoing Fee"},
+    {"pattern": r"cashless\s+roll", "request_type": "Commitment Change", "sub_request_type": "Cashless Roll"},
+    {"pattern": r"commitment (has been |was )?(increased|upsized)", "request_type": "Commitment Change", "sub_request_type": "Increase"},
+    {"pattern": r"commitment (has been |was )?(decreased|reduced|downsized)", "request_type": "Commitment Change", "sub_request_type": "Decrease"},
+    {"pattern": r"lender shares? of facility .{0,80}(have|has) been adjusted", "request_type": "Money Movement Inbound",
+     "additional_request_types": ["Adjustment"]},
+    {"pattern": r"assignment (agreement|of (the )?loan)|au transfer", "request_type": "AU Transfer"},
+    {"pattern": r"(outgoing|outbound) (wire|payment) in (eur|gbp|cad|jpy|chf)", "request_type": "Money Movement Outbound",
+     "sub_request_type": "Foreign Currency"},
+]
+FAST_PATH_CENTROID_EXAMPLES = {  # Typical agent notices per request type; reviewed emails are added at runtime
+    "Adjustment": [
+        "Please note that the lender shares of the facility have been adjusted following the rebalancing. "
+        "Your revised share and the resulting adjustment amount are shown below.",
+    ],
+    "AU Transfer": [
+        "We confirm the assignment of the loan to the new lender under the assignment agreement effective today. "
+        "Please update the register for the transfer of commitments.",
+    ],
+    "Closing Notice": [
+        "This closing notice confirms the reallocation of principal among lenders on the closing date, "
+        "together with the reallocation and amendment fees payable.",
+    ],
+    "Commitment Change": [
+        "The total commitment under the revolving credit facility has been increased. "
+        "Your new commitment amount is effective from the date below.",
+        "Please be advised the lenders' commitments were reduced pursuant to the permanent commitment reduction notice.",
+    ],
+    "Fee Payment": [
+        "Please find the quarterly ongoing commitment fee payment for the facility. "
+        "The fee amount has been remitted to your account for the period shown.",
+        "The letter of credit fee for the current period is payable on the payment date below.",
+    ],
+    "Money Movement Inbound": [
+        "The borrower has made a repayment of principal and interest. "
+        "Your share of the payment will be remitted to your account on the value date.",
+    ],
+    "Money Movement Outbound": [
+        "Please fund your share of the drawdown by the funding date. "
+        "The outgoing wire in foreign currency must be sent to the account below.",
+    ],
+}
+FEEDBACK_KNN_ENABLED = True  # Answer emails close to reviewed ones from their labels (independent of the fast path)
+FEEDBACK_KNN_K = 10  # Reviewed emails consulted per new email
+FEEDBACK_MIN_SIMILARITY = 0.85  # Cosine similarity for a reviewed email to vote on a new one
+FEEDBACK_EXACT_SIMILARITY = 0.97  # A single reviewed email this close is enough to decide
+FEEDBACK_MIN_NEIGHBOURS = 2  # Otherwise this many agreeing votes are needed for full confidence
+FEEDBACK_KNN_THRESHOLD = 0.8  # Minimum kNN confidence to skip the classification crew
+FEEDBACK_FEW_SHOT_K = 3  # Closest reviewed emails shown to the classifier as examples
+FEEDBACK_EXAMPLE_CHARS = 600  # Text kept per reviewed email for few-shot prompts
+FEEDBACK_REFRESH_SECONDS = 30  # How often a running worker checks for new feedback
+LLM_PROMPT_VERSION = "3"  # Bump whenever a task prompt changes, to invalidate cached answers
+LLM_CACHE_FILE = "llm_cache.sqlite"
+LLM_CACHE_TTL = 30 * 24 * 3600  # Seconds a cached LLM answer stays valid
+LLM_CACHE_MAX_ENTRIES = 50000  # Least recently used answers are evicted beyond this
+
+# Dashboard settings
+RESULTS_PAGE_SIZES = [10, 25, 50, 100]  # Emails per page offered in the results view (second is the default)
+RESULTS_DETAIL_CACHE_SIZE = 200  # Opened emails (body + result) kept in memory, shared by all sessions
+
+# Worker settings
+WORKER_INTERVAL = 60  # Seconds between runs of `python worker.py daemon`
+SCHEDULER_JITTER = 0.1  # Each delay varies by +/- this fraction
+SCHEDULER_MAX_BACKOFF = 1800  # Longest delay after repeated throttled runs (Gmail or LLM rate limits)
+WORKER_STATUS_EVERY = 5  # Seconds between scheduler status updates the daemon stores for the UI
+AUTO_REFRESH_STATUS_EVERY = 5  # Seconds between polls of the daemon's status in the UI while auto-refresh is on
+
+# State store settings
+STATE_DB_FILE = "state.sqlite"  # Processed IDs, email metadata, results and sync checkpoints
+STATE_BUSY_TIMEOUT = 30  # Seconds a write waits for the other process (worker or viewer) to commit
+JOB_MAX_ATTEMPTS = 5  # Attempts before an email goes to the dead-letter list
+JOB_BACKOFF_BASE = 30  # Seconds before the first retry; doubles with each attempt
+JOB_BACKOFF_MAX = 3600
+JOB_RATE_LIMIT_BACKOFF_FACTOR = 4  # Provider rate limits back off this much longer
+JOB_LEASE_SECONDS = 900  # A running job not finished by then (crashed worker) is picked up again
+
+# Gmail settings
+SYNC_MODE = "incremental"  # "incremental" (history API) or "full" (re-list the inbox)
+GMAIL_BATCH_SIZE = 100  # messages().get calls per batch HTTP request (Gmail allows up to 100)
+
+# Duplicate detection settings
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DIMENSION = 384  # all-MiniLM-L6-v2 output size
+EMBEDDING_BATCH_SIZE = 32  # Emails encoded per model call
+VECTOR_STORE_DIR = "vector_store"  # FAISS index, append log and metadata table
+VECTOR_COMPACT_EVERY = 1000  # Write the in-memory delta out as an on-disk segment after this many inserts
+VECTOR_MAX_SEGMENTS = 8  # Segments kept before they are merged (or the index rebuilt)
+VECTOR_STORE_TEXT_CHARS = 2000  # Email text kept per vector for duplicate prompts
+DUPLICATE_COSINE_THRESHOLD = 0.65  # Same cut-off as the old squared-L2 < 0.7 on unit MiniLM vectors
+DUPLICATE_TOP_K = 3  # Vector-search hits kept per email (IDs and scores are stored with the result)
+DUPLICATE_SNIPPET_CHARS = 200  # Text per hit in the duplicate prompt summary
+ANN_INDEX_KIND = "flat"  # "flat" (exact), "ivfpq" or "hnsw"
+ANN_INDEX_PARAMS = {
+    "nlist": 4096,           # IVF lists (capped at ~4*sqrt(n) for small corpora)
+    "nprobe": 16,            # IVF lists scanned per query
+    "pq_m": 48,              # PQ sub-quantisers (must divide EMBEDDING_DIMENSION)
+    "pq_bits": 8,            # Bits per PQ code
+    "min_train_size": 10000, # IVF-PQ stays on an exact flat index below this many vectors
+    "rerank_candidates": 64, # IVF-PQ hits re-scored with the exact vectors before the duplicate threshold
+    "train_sample": 100000,  # Vectors sampled for IVF-PQ training
+    "hnsw_m": 32,            # HNSW graph degree
+    "ef_construction": 200,
+    "ef_search": 64,
+}
+ANN_REBUILD_GROWTH = 2.0  # Retrain/rebuild the index once the corpus grows by this factor
+DEDUP_ENABLED = True  # Message-ID, content hash and SimHash checks before embedding (see dedup.py)
+SIMHASH_SHINGLE_SIZE = 2  # Words per SimHash feature
+SIMHASH_MIN_WORDS = 20  # Shorter bodies ("see attached") only get the exact checks
+SIMHASH_MAX_DISTANCE = 5  # Differing bits (of 64) still counted as a near duplicate
+SIMHASH_THREAD_MAX_DISTANCE = 10  # Looser cut-off between emails of the same Gmail thread
+SIMHASH_BANDS = 6  # LSH bands; must exceed SIMHASH_MAX_DISTANCE (changing it needs a fresh state.sqlite)
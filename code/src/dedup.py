@@ -0,0 +1,239 @@
+# dedup.py - Cheap duplicate checks run before embedding: Message-ID, content hash, then SimHash
+import hashlib
+import re
+import threading
+import time
+
+import numpy as np
+
+from config import (
+    SIMHASH_SHINGLE_SIZE, SIMHASH_MIN_WORDS, SIMHASH_MAX_DISTANCE, SIMHASH_THREAD_MAX_DISTANCE, SIMHASH_BANDS
+)
+from attachment_cache import file_sha256
+from models import DuplicateCheckResult
+
+MESSAGE_ID, CONTENT_HASH, NEAR_DUPLICATE = "message_id", "content_hash", "near_duplicate"
+# Matches on these tiers are the same email, so its stored result can be reused as is
+EXACT_TIERS = (MESSAGE_ID, CONTENT_HASH)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    email_id TEXT PRIMARY KEY,
+    message_id TEXT,
+    thread_id TEXT,
+    content_hash TEXT,
+    attachments_hash TEXT NOT NULL,
+    simhash INTEGER,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fingerprints_message_id ON fingerprints (message_id);
+CREATE INDEX IF NOT EXISTS fingerprints_content_hash ON fingerprints (content_hash);
+CREATE INDEX IF NOT EXISTS fingerprints_thread_id ON fingerprints (thread_id);
+CREATE TABLE IF NOT EXISTS simhash_bands (
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    email_id TEXT NOT NULL,
+    PRIMARY KEY (band, value, email_id)
+);
+"""
+
+FORWARD_MARKER = re.compile(r"^-{2,}\s*(forwarded message|original message)\s*-{2,}$", re.IGNORECASE)
+FORWARD_HEADER = re.compile(r"^(from|sent|date|to|cc|subject):", re.IGNORECASE)
+REPLY_HEADER = re.compile(r"^on .{0,200} wrote:$", re.IGNORECASE)
+
+MASK_64 = (1 << 64) - 1
+
+
+def normalize_body(text):
+    """Lowercased body with whitespace collapsed, quoted reply lines and forwarding headers removed"""
+    lines, in_forward_header = [], False
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if FORWARD_MARKER.match(line):
+            in_forward_header = True
+            continue
+        if in_forward_header:
+            if not line or FORWARD_HEADER.match(line):
+                continue
+            in_forward_header = False
+        if line.startswith(">") or REPLY_HEADER.match(line):
+            continue
+        lines.append(line)
+    return " ".join(" ".join(lines).lower().split())
+
+
+def simhash(text, shingle_size=SIMHASH_SHINGLE_SIZE, min_words=SIMHASH_MIN_WORDS):
+    """64-bit SimHash over word shingles of normalised text, or None for short texts"""
+    words = text.split()
+    if len(words) < min_words:
+        return None
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    digests = b"".join(hashlib.blake2b(shingle.encode(), digest_size=8).digest() for shingle in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(-1, 64)
+    # A bit is set when most shingles set it
+    majority = bits.sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(majority).tobytes(), "big")
+
+
+def hamming(a, b):
+    return bin((a ^ b) & MASK_64).count("1")
+
+
+def simhash_bands(value, bands=SIMHASH_BANDS):
+    """Split a SimHash into equal bit bands; hashes within bands - 1 bits share at least one band"""
+    width = 64 // bands
+    return [(value >> (band * width)) & ((1 << width) - 1) for band in range(bands)]
+
+
+def to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def fingerprint_email(email):
+    """Hashes the dedup tiers compare; reads the downloaded attachment files"""
+    body = normalize_body(email.get("full_body") or email.get("snippet", ""))
+    attachment_hashes = sorted(file_sha256(attachment["path"]) for attachment in email.get("attachments") or [])
+    attachments_hash = hashlib.sha256("\n".join(attachment_hashes).encode()).hexdigest()
+    return {
+        "message_id": email.get("message_id"),
+        "thread_id": email.get("thread_id"),
+        # An empty body without attachments ("Thanks!") says nothing about the request
+        "content_hash": (
+            hashlib.sha256(f"{body}\n{attachments_hash}".encode()).hexdigest() if body or attachment_hashes else None
+        ),
+        "attachments_hash": attachments_hash,
+        "simhash": simhash(body),
+    }
+
+
+def duplicate_of(match):
+    """The DuplicateCheckResult reported for a dedup match"""
+    reasons = {
+        MESSAGE_ID: "has the same Message-ID as",
+        CONTENT_HASH: "has the same body and attachments as",
+        NEAR_DUPLICATE: f"is nearly identical ({match['distance']} of 64 SimHash bits differ) to",
+    }
+    return DuplicateCheckResult(
+        duplicate_flag=True,
+        duplicate_reason=f"This email {reasons[match['tier']]} email {match['email_id']}.",
+        matched_email_ids=[match["email_id"]],
+        # Fraction of matching SimHash bits; 1.0 for the exact tiers
+        scores=[round(1 - match["distance"] / 64, 4)],
+    )
+
+
+class DedupIndex:
+    """Fingerprints of every processed email, in the state store's database.
+
+    check() tries, in order: the Message-ID header, a hash of the normalised
+    body plus attachment contents (catches resends and forwards), and a SimHash
+    within SIMHASH_MAX_DISTANCE bits (SIMHASH_THREAD_MAX_DISTANCE inside one
+    Gmail thread) with the same attachments. Every tier is an indexed lookup,
+    so only emails that pass all of them need an embedding and a vector search.
+    """
+
+    def __init__(self, state_store):
+        self.store = state_store
+        self.db = state_store.db
+        self.lock = state_store.lock
+        self.stats_lock = threading.Lock()
+        self._stats = {"checked": 0, MESSAGE_ID: 0, CONTENT_HASH: 0, NEAR_DUPLICATE: 0}
+        with self.lock:
+            self.db.executescript(SCHEMA)
+            self.db.commit()
+
+    def check(self, email):
+        """Record the email's fingerprint; returns the earlier email it duplicates as
+        {"tier", "email_id", "distance"}, or None
+        """
+        fingerprint = fingerprint_email(email)
+        # Lookup and insert must not interleave, or two copies processed together would miss each other
+        with self.store.transaction():
+            match = self._find(email["id"], fingerprint)
+            self._add(email["id"], fingerprint)
+        with self.stats_lock:
+            self._stats["checked"] += 1
+            if match:
+                self._stats[match["tier"]] += 1
+        return match
+
+    def _first(self, column, value, email_id):
+        row = self.db.execute(
+            f"SELECT email_id FROM fingerprints WHERE {column} = ? AND email_id != ? ORDER BY created_at LIMIT 1",
+            (value, email_id),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _find(self, email_id, fingerprint):
+        for tier in EXACT_TIERS:
+            if fingerprint[tier]:
+                original = self._first(tier, fingerprint[tier], email_id)
+                if original:
+                    return {"tier": tier, "email_id": original, "distance": 0}
+
+        value = fingerprint["simhash"]
+        if value is None:
+            return None
+        candidates = []
+        for band, band_value in enumerate(simhash_bands(value)):
+            candidates += [
+                (original, other, SIMHASH_MAX_DISTANCE) for original, other in self.db.execute(
+                    """SELECT email_id, simhash FROM simhash_bands JOIN fingerprints USING (email_id)
+                       WHERE band = ? AND value = ? AND attachments_hash = ? AND email_id != ?""",
+                    (band, band_value, fingerprint["attachments_hash"], email_id),
+                )
+            ]
+        if fingerprint["thread_id"]:
+            candidates += [
+                (original, other, SIMHASH_THREAD_MAX_DISTANCE) for original, other in self.db.execute(
+                    """SELECT email_id, simhash FROM fingerprints
+                       WHERE thread_id = ? AND attachments_hash = ? AND simhash IS NOT NULL AND email_id != ?""",
+                    (fingerprint["thread_id"], fingerprint["attachments_hash"], email_id),
+                )
+            ]
+        close = []
+        for original, other, limit in candidates:
+            distance = hamming(value, other)
+            if distance <= limit:
+                close.append((distance, original))
+        if not close:
+            return None
+        distance, original = min(close)
+        return {"tier": NEAR_DUPLICATE, "email_id": original, "distance": distance}
+
+    def _add(self, email_id, fingerprint):
+        value = fingerprint["simhash"]
+        self.db.execute(
+            """INSERT OR REPLACE INTO fingerprints
+               (email_id, message_id, thread_id, content_hash, attachments_hash, simhash, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (email_id, fingerprint["message_id"], fingerprint["thread_id"], fingerprint["content_hash"],
+             fingerprint["attachments_hash"], None if value is None else to_signed(value), time.time()),
+        )
+        self.db.execute("DELETE FROM simhash_bands WHERE email_id = ?", (email_id,))
+        if value is not None:
+            self.db.executemany(
+                "INSERT INTO simhash_bands (band, value, email_id) VALUES (?, ?, ?)",
+                [(band, band_value, email_id) for band, band_value in enumerate(simhash_bands(value))],
+            )
+
+    def stats(self):
+        """Emails checked and duplicates found per tier by this process"""
+        with self.stats_lock:
+            return dict(self._stats)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_dedup_index():
+    """Return the process-wide dedup index on the shared state store"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from state_store import get_state_store
+                _index = DedupIndex(get_state_store())
+    return _index
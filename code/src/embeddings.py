@@ -0,0 +1,30 @@
+# embeddings.py - Shared sentence embedding model
+import threading
+
+from config import EMBEDDING_MODEL_NAME, EMBEDDING_BATCH_SIZE
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_embedding_model():
+    """Load the SentenceTransformer on first use and share it across the process"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _model
+
+
+def encode(texts, batch_size=EMBEDDING_BATCH_SIZE):
+    """Encode a list of texts in batches; returns a float32 array with one unit vector per text"""
+    return get_embedding_model().encode(
+        list(texts), batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True
+    ).astype("float32")
+
+
+def encode_one(text):
+    """Encode a single text"""
+    return encode([text])[0]
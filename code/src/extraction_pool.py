@@ -0,0 +1,172 @@
+# extraction_pool.py - Attachment extraction in worker processes with time and memory limits
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from attachment_cache import file_sha256, get_cached_text, put_cached_text
+from extractor import HEAVY_MODULES, file_kind
+from config import EXTRACTION_WORKERS, EXTRACTION_TIMEOUT, EXTRACTION_MEMORY_LIMIT
+from models import AttachmentExtraction
+
+
+def _extract_in_child(file_path, conn, memory_limit):
+    """Child process: stream text chunks back to the parent as they are extracted"""
+    try:
+        if memory_limit:
+            try:
+                import resource
+                resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+            except (ImportError, ValueError, OSError):
+                pass  # Not supported on this platform; the wall-clock limit still applies
+        from extractor import iter_text_chunks
+        for chunk in iter_text_chunks(file_path):
+            conn.send(("chunk", chunk))
+        conn.send(("done", None))
+    except MemoryError:
+        conn.send(("error", f"memory limit of {memory_limit // (1024 * 1024)} MB exceeded"))
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+class ExtractionExecutor:
+    """Runs extract jobs in separate processes, at most max_workers at a time.
+
+    Each file gets its own process so a runaway OCR or PDF job can be killed
+    when it passes its wall-clock timeout, hits the memory limit or its batch is
+    cancelled, without taking the app down. Text received before that point is
+    kept and returned as a partial result.
+    """
+
+    def __init__(self, max_workers=EXTRACTION_WORKERS, timeout=EXTRACTION_TIMEOUT, memory_limit=EXTRACTION_MEMORY_LIMIT):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        methods = multiprocessing.get_all_start_methods()
+        # Forking a threaded process is unsafe; the fork server imports the extractor and its parsers once instead
+        self.context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if "forkserver" in methods:
+            self.context.set_forkserver_preload(["extractor", *HEAVY_MODULES])
+        self.supervisors = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extract")
+        self.closing = threading.Event()
+        self.processes = set()
+        self.lock = threading.Lock()
+
+    def submit(self, file_path, cancelled=None):
+        """Schedule a file; returns a Future resolving to an AttachmentExtraction.
+
+        Setting the cancelled event (shared by one batch of files) stops the job
+        if it is queued or running; it resolves with an error and any partial text.
+        """
+        return self.supervisors.submit(self._run, file_path, cancelled or threading.Event())
+
+    def extract(self, file_path):
+        return self.submit(file_path).result()
+
+    def shutdown(self):
+        """Kill every running job and stop accepting new ones"""
+        self.closing.set()
+        with self.lock:
+            for process in list(self.processes):
+                process.kill()
+        self.supervisors.shutdown(wait=True)
+
+    def _run(self, file_path, cancelled):
+        if cancelled.is_set() or self.closing.is_set():
+            return AttachmentExtraction(path=file_path, error="cancelled", complete=False)
+
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=_extract_in_child, args=(file_path, sender, self.memory_limit), daemon=True
+        )
+        with self.lock:
+            self.processes.add(process)
+        chunks = []
+        error = None
+        try:
+            process.start()
+            sender.close()
+            deadline = time.monotonic() + self.timeout
+            while True:
+                if cancelled.is_set() or self.closing.is_set():
+                    error = "cancelled"
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    error = f"timed out after {self.timeout}s"
+                    break
+                if not receiver.poll(min(remaining, 0.5)):
+                    continue
+                try:
+                    kind, value = receiver.recv()
+                except EOFError:
+                    process.join(1)
+                    error = f"worker exited unexpectedly (exit code {process.exitcode})"
+                    break
+                if kind == "chunk":
+                    chunks.append(value)
+                elif kind == "done":
+                    break
+                else:
+                    error = value
+                    break
+        finally:
+            if process.is_alive():
+                process.kill()
+            process.join()
+            receiver.close()
+            with self.lock:
+                self.processes.discard(process)
+
+        return AttachmentExtraction(
+            path=file_path, text="\n".join(chunks).strip(), error=error, complete=error is None
+        )
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_extraction_executor():
+    """Return the process-wide executor, creating it on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ExtractionExecutor()
+    return _executor
+
+
+def extract_attachments(file_paths, cancelled=None):
+    """Extract every file concurrently; returns one AttachmentExtraction per path, in order.
+
+    Files already in the attachment text cache, and file types the extractor
+    does not read, skip the worker pool entirely. Only complete extractions are
+    cached. Setting the cancelled event stops this batch's remaining jobs.
+    """
+    executor = get_extraction_executor()
+    results = {}
+    pending = {}
+    for file_path in file_paths:
+        if file_kind(file_path) is None:
+            results[file_path] = AttachmentExtraction(path=file_path)
+            continue
+        try:
+            digest = file_sha256(file_path)
+        except OSError as e:
+            results[file_path] = AttachmentExtraction(path=file_path, error=str(e), complete=False)
+            continue
+        text = get_cached_text(digest)
+        if text is not None:
+            results[file_path] = AttachmentExtraction(path=file_path, text=text)
+        else:
+            pending[file_path] = (digest, executor.submit(file_path, cancelled))
+
+    for file_path, (digest, future) in pending.items():
+        outcome = future.result()
+        if outcome.complete and outcome.text:
+            put_cached_text(digest, outcome.text)
+        results[file_path] = outcome
+
+    return [results[file_path] for file_path in file_paths]
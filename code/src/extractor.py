@@ -1,72 +1,202 @@
-import os
-import pandas as pd
-import cv2
-import pdfplumber
-import pytesseract
-from PIL import Image
-from pptx import Presentation
-
-# Set the path to Tesseract executable
-# Windows example:
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-# Linux/Mac example:
-# pytesseract.pytesseract.tesseract_cmd = '/usr/bin/tesseract'
+import datetime
+from config import EXTRACTION_CHAR_BUDGET, OCR_RESOLUTION
+
+# Parser libraries are imported on first use of their file type, so importing this
+# module stays cheap; the extraction worker processes preload them (see extraction_pool.py)
+HEAVY_MODULES = ["cv2", "openpyxl", "pandas", "pdfplumber", "pptx", "pytesseract"]
+
+_pytesseract = None
+
+
+def get_pytesseract():
+    """Import pytesseract and point it at the Tesseract executable"""
+    global _pytesseract
+    if _pytesseract is None:
+        import pytesseract
+        # Set the path to Tesseract executable
+        # Windows example:
+        pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+        # Linux/Mac example:
+        # pytesseract.pytesseract.tesseract_cmd = '/usr/bin/tesseract'
+        _pytesseract = pytesseract
+    return _pytesseract
+
+# Bump when extraction output changes, to invalidate the attachment text cache
+EXTRACTOR_VERSION = 3
+
+# Spreadsheet rows sent per extracted chunk
+ROWS_PER_CHUNK = 200
+
+FILE_KINDS = {
+    "png": "image", "jpg": "image", "jpeg": "image",
+    "pdf": "PDF",
+    "xls": "Excel", "xlsx": "Excel",
+    "pptx": "PowerPoint file",
+}
+
+
+def iter_image_text(file_path):
+    """OCR an image file"""
+    import cv2
+    # Image OCR using pytesseract
+    image = cv2.imread(file_path)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+
+    # Use pytesseract for text extraction
+    yield get_pytesseract().image_to_string(gray)
+
+
+def ocr_pdf_page(page):
+    """OCR a rendered PDF page (for scans without a text layer)"""
+    image = page.to_image(resolution=OCR_RESOLUTION).original
+    return get_pytesseract().image_to_string(image)
+
+
+def iter_pdf_text(file_path):
+    """Yield the text of each PDF page that has any, one page at a time.
+
+    Each page's text layer is extracted exactly once, and the page's parsed
+    layout is released before moving on, so memory does not grow with the
+    page count. Only pages with no text layer but embedded images are OCR'd.
+    """
+    import pdfplumber
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages:
+            try:
+                text = page.extract_text()
+                if not (text and text.strip()) and page.images:
+                    text = ocr_pdf_page(page)
+            finally:
+                page.close()
+            if text and text.strip():
+                yield text
+
+
+def format_cell(value):
+    """Render a spreadsheet cell compactly (no padding, no trailing .0 on whole numbers)"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time():
+        return value.date().isoformat()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value).replace("\t", " ").replace("\n", " ").strip()
+
+
+def rows_to_tsv(rows):
+    """Yield one tab-separated line per non-empty row, trailing empty cells dropped"""
+    for row in rows:
+        cells = [format_cell(value) for value in row]
+        while cells and not cells[-1]:
+            cells.pop()
+        if cells:
+            yield "\t".join(cells)
+
+
+def iter_tsv_blocks(title, lines, rows_per_chunk=ROWS_PER_CHUNK):
+    """Group TSV lines into chunks of rows_per_chunk lines under a title line"""
+    block = [title]
+    for line in lines:
+        block.append(line)
+        if len(block) > rows_per_chunk:
+            yield "\n".join(block)
+            block = []
+    if block and block != [title]:
+        yield "\n".join(block)
+
+
+def iter_excel_text(file_path):
+    """Yield each sheet of a workbook as compact TSV, a block of rows at a time.
+
+    .xlsx is streamed with openpyxl in read-only mode, so the workbook is never
+    fully loaded; legacy .xls (which openpyxl cannot read) goes through pandas.
+    """
+    if file_path.lower().endswith(".xls"):
+        import pandas as pd
+        for name, df in pd.read_excel(file_path, sheet_name=None, header=None).items():
+            yield from iter_tsv_blocks(f"## Sheet: {name}", rows_to_tsv(df.itertuples(index=False)))
+        return
+
+    import openpyxl
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield from iter_tsv_blocks(f"## Sheet: {sheet.title}", rows_to_tsv(sheet.iter_rows(values_only=True)))
+    finally:
+        workbook.close()
+
+
+def iter_shape_text(shapes):
+    """Yield the text of slide shapes, descending into groups and rendering tables as TSV"""
+    from pptx.enum.shapes import MSO_SHAPE_TYPE
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            yield from iter_shape_text(shape.shapes)
+        elif getattr(shape, "has_table", False) and shape.has_table:
+            lines = list(rows_to_tsv([cell.text for cell in row.cells] for row in shape.table.rows))
+            if lines:
+                yield "\n".join(lines)
+        elif getattr(shape, "has_text_frame", False) and shape.has_text_frame and shape.text_frame.text.strip():
+            yield shape.text_frame.text.strip()
+
+
+def iter_pptx_text(file_path):
+    """Yield the text of each slide, one slide at a time"""
+    from pptx import Presentation
+    presentation = Presentation(file_path)
+    for slide in presentation.slides:
+        texts = list(iter_shape_text(slide.shapes))
+        if texts:
+            yield "\n".join(texts)
+
+
+CHUNK_READERS = {
+    "image": iter_image_text,
+    "PDF": iter_pdf_text,
+    "Excel": iter_excel_text,
+    "PowerPoint file": iter_pptx_text,
+}
+
+
+def file_kind(file_path):
+    """The FILE_KINDS name for a path's extension, or None if it is not extracted"""
+    return FILE_KINDS.get(file_path.lower().split(".")[-1])
+
+
+def iter_text_chunks(file_path, char_budget=EXTRACTION_CHAR_BUDGET):
+    """Yield extracted text piece by piece (page, sheet, slide...); raises on unreadable files
+
+    Stops reading the file as soon as char_budget characters have been
+    produced (None for no limit); the last piece is cut to fit.
+    """
+    kind = file_kind(file_path)
+    if kind is None:
+        return
+    chunks = CHUNK_READERS[kind](file_path)
+    remaining = char_budget
+    try:
+        for chunk in chunks:
+            if remaining is not None:
+                chunk = chunk[:remaining]
+                remaining -= len(chunk)
+            yield chunk
+            if remaining is not None and remaining <= 0:
+                break
+    finally:
+        # Early exit: close the reader so the file is released without parsing the rest
+        chunks.close()
+
 
 def extract_text_from_file(file_path):
     """Extracts text from PDF, Images, Excel, and PowerPoint files."""
-    ext = file_path.lower().split(".")[-1]
-    extracted_text = ""
-
-    if ext in ["png", "jpg", "jpeg"]:
-        print("$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$")
-        try:
-            # Image OCR using pytesseract
-            image = cv2.imread(file_path)
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
-
-            # Use pytesseract for text extraction
-            extracted_text = pytesseract.image_to_string(gray)
-
-            print("$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$")
-            print(extracted_text)
-
-        except Exception as e:
-            print(f"Error processing image: {e}")
-            extracted_text = ""
-
-    elif ext == "pdf":
-        try:
-            with pdfplumber.open(file_path) as pdf:
-                extracted_text = "\n".join(
-                    page.extract_text() for page in pdf.pages if page.extract_text()
-                )
-        except Exception as e:
-            print(f"Error processing PDF: {e}")
-            extracted_text = ""
-
-    elif ext in ["xls", "xlsx"]:
-        try:
-            df = pd.read_excel(file_path, sheet_name=None)
-            extracted_text = "\n".join(
-                df[sheet].to_string() for sheet in df
-            )
-        except Exception as e:
-            print(f"Error processing Excel: {e}")
-            extracted_text = ""
-
-    elif ext == "pptx":
-        try:
-            presentation = Presentation(file_path)
-            extracted_text = []
-            for slide in presentation.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, "text") and shape.text.strip():
-                        extracted_text.append(shape.text.strip())
-            extracted_text = "\n".join(extracted_text)
-        except Exception as e:
-            print(f"Error processing PowerPoint file: {e}")
-            extracted_text = ""
+    try:
+        extracted_text = "\n".join(iter_text_chunks(file_path))
+    except Exception as e:
+        kind = file_kind(file_path) or "file"
+        print(f"Error processing {kind}: {e}")
+        extracted_text = ""
 
     return extracted_text.strip()
-
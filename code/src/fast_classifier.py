@@ -0,0 +1,165 @@
+# fast_classifier.py - Local rule + embedding classifier that answers routine emails without the LLM
+import re
+import threading
+
+import numpy as np
+
+from config import (
+    REQUEST_TYPES, FAST_PATH_RULES, FAST_PATH_THRESHOLD, FAST_PATH_TEMPERATURE, FAST_PATH_CENTROID_EXAMPLES
+)
+from models import ClassificationResult
+
+_lock = threading.Lock()
+_rules = None
+_seed_vectors = None
+_centroids = None
+_centroids_version = None
+_stats = {"fast_path": 0, "llm": 0}
+
+
+def build_rules():
+    """Compile keyword rules from REQUEST_TYPES plus the extra FAST_PATH_RULES.
+
+    Each rule is (regex, request type, sub type or None, weight, additional
+    types, generic); generic marks the rules made from REQUEST_TYPES names.
+    Multi-word names are distinctive and weigh more than single generic words
+    such as "Increase" or "Interest".
+    """
+    rules = []
+    for request_type, sub_types in REQUEST_TYPES.items():
+        rules.append((_phrase(request_type), request_type, None, 2.0 if " " in request_type else 1.0, [], True))
+        for sub_type in sub_types:
+            weight = 2.0 if re.search(r"[\s+]", sub_type) else 0.5
+            rules.append((_phrase(sub_type), request_type, sub_type, weight, [], True))
+    for rule in FAST_PATH_RULES:
+        rules.append((
+            re.compile(rule["pattern"], re.IGNORECASE | re.DOTALL), rule["request_type"],
+            rule.get("sub_request_type"), rule.get("weight", 3.0), rule.get("additional_request_types", []), False,
+        ))
+    return rules
+
+
+def _phrase(name):
+    # "Principal+Interest" should also match "principal + interest" / "principal and interest"
+    words = [re.escape(word) for word in re.split(r"\s*\+\s*|\s+", name)]
+    return re.compile(r"\b" + r"\s*(?:\+|and|&)?\s*".join(words) + r"\b", re.IGNORECASE)
+
+
+def get_rules():
+    global _rules
+    if _rules is None:
+        _rules = build_rules()
+    return _rules
+
+
+def centroid_examples():
+    """Seed texts whose embeddings form each request type's centroid: {request type: [texts]}"""
+    return {
+        request_type: FAST_PATH_CENTROID_EXAMPLES.get(request_type) or [request_type]
+        for request_type in REQUEST_TYPES
+    }
+
+
+def get_centroids():
+    """(request types, unit centroid matrix) over the seed examples plus every reviewed email.
+
+    The seeds are embedded once per process; the centroids are recomputed when
+    reviewers add feedback, so they move towards this inbox's real emails.
+    """
+    global _seed_vectors, _centroids, _centroids_version
+    from feedback_classifier import get_feedback_index
+    labels, vectors, version = get_feedback_index().examples()
+    with _lock:
+        if _seed_vectors is None:
+            from embeddings import encode
+            _seed_vectors = {
+                request_type: [row / np.linalg.norm(row) for row in encode(texts)]
+                for request_type, texts in centroid_examples().items()
+            }
+        if _centroids is None or version != _centroids_version:
+            members = {request_type: list(rows) for request_type, rows in _seed_vectors.items()}
+            for (primary, _), vector in zip(labels, vectors if vectors is not None else []):
+                if primary in members:
+                    members[primary].append(vector)
+            names, rows = [], []
+            for request_type, request_vectors in members.items():
+                centroid = np.mean(request_vectors, axis=0)
+                names.append(request_type)
+                rows.append(centroid / np.linalg.norm(centroid))
+            _centroids, _centroids_version = (names, np.vstack(rows).astype("float32")), version
+    return _centroids
+
+
+def score_rules(email_text):
+    """Return ({request type: score}, {request type: best sub type}, {request type: additional types}, matched names)
+
+    A type that a matched FAST_PATH_RULES rule already lists as additional
+    gets no votes from its generic name: "Lender Shares ... adjusted" says
+    Adjustment as part of an inbound money movement, not as a rival answer.
+    """
+    hits = [rule for rule in get_rules() if rule[0].search(email_text)]
+    explained = {extra_type for _, _, _, _, extra, generic in hits if not generic for extra_type in extra}
+    scores, sub_types, sub_scores, additional, matched = {}, {}, {}, {}, []
+    for _, request_type, sub_type, weight, extra, generic in hits:
+        if generic and request_type in explained:
+            continue
+        matched.append(sub_type or request_type)
+        scores[request_type] = scores.get(request_type, 0.0) + weight
+        if sub_type and weight > sub_scores.get(request_type, 0.0):
+            sub_types[request_type], sub_scores[request_type] = sub_type, weight
+        additional.setdefault(request_type, []).extend(extra)
+    return scores, sub_types, additional, matched
+
+
+def score_centroids(embedding):
+    """Return {request type: probability} from a softmax over cosine similarity to each centroid"""
+    names, centroids = get_centroids()
+    similarities = centroids @ (np.asarray(embedding, dtype="float32") / np.linalg.norm(embedding))
+    weights = np.exp((similarities - similarities.max()) / FAST_PATH_TEMPERATURE)
+    return dict(zip(names, (weights / weights.sum()).tolist()))
+
+
+def classify_fast(email_text, embedding=None, threshold=FAST_PATH_THRESHOLD):
+    """Return a ClassificationResult when the local classifiers are confident enough, else None.
+
+    Rule confidence is the top type's share of the rule evidence, discounted
+    until at least two points of evidence agree. When an embedding is given,
+    the nearest-centroid classifier must pick the same type and the two
+    confidences are combined; if they disagree the email goes to the LLM.
+    """
+    scores, sub_types, additional, matched = score_rules(email_text)
+    if not scores:
+        return None
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    primary, top_score = ranked[0]
+    confidence = (top_score / sum(scores.values())) * min(1.0, top_score / 2.0)
+
+    if embedding is not None:
+        probabilities = score_centroids(embedding)
+        if max(probabilities, key=probabilities.get) != primary:
+            return None
+        confidence = 1 - (1 - confidence) * (1 - probabilities[primary])
+
+    if confidence < threshold:
+        return None
+    others = [request_type for request_type, _ in ranked[1:]] + additional.get(primary, [])
+    return ClassificationResult(
+        primary_request_type=primary,
+        sub_request_type=sub_types.get(primary),
+        confidence_score=round(confidence, 2),
+        additional_request_types=list(dict.fromkeys(t for t in others if t != primary)) or None,
+        reason=f"Fast path: matched {', '.join(dict.fromkeys(matched))}",
+    )
+
+
+def record_outcome(handled):
+    """Count an email as answered by the fast path or sent to the LLM"""
+    with _lock:
+        _stats["fast_path" if handled else "llm"] += 1
+
+
+def fast_path_stats():
+    """Return counts and the fraction of emails the fast path handled"""
+    with _lock:
+        total = _stats["fast_path"] + _stats["llm"]
+        return {**_stats, "total": total, "fraction": _stats["fast_path"] / total if total else 0.0}
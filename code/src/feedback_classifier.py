@@ -0,0 +1,130 @@
+# feedback_classifier.py - kNN over reviewer-approved/corrected emails: local answers and few-shot examples
+import threading
+import time
+
+import numpy as np
+
+from config import (
+    FEEDBACK_KNN_K, FEEDBACK_MIN_SIMILARITY, FEEDBACK_EXACT_SIMILARITY, FEEDBACK_MIN_NEIGHBOURS,
+    FEEDBACK_KNN_THRESHOLD, FEEDBACK_FEW_SHOT_K, FEEDBACK_REFRESH_SECONDS
+)
+from models import ClassificationResult
+
+
+class FeedbackIndex:
+    """In-memory copy of the feedback vectors, reloaded when reviewers add feedback.
+
+    The store is checked for new feedback at most every refresh_seconds, so the
+    check costs nothing noticeable per email.
+    """
+
+    def __init__(self, store, refresh_seconds=FEEDBACK_REFRESH_SECONDS):
+        self.store = store
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked_at = 0.0
+        self.labels, self.texts, self.vectors = [], [], None
+        self.stats_lock = threading.Lock()
+        self._stats = {"checked": 0, "answered": 0}
+
+    def _refresh(self):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.checked_at < self.refresh_seconds:
+                return
+            self.checked_at = now
+            version = self.store.feedback_version()
+            if version == self.version:
+                return
+            labels, texts, vectors = self.store.load_feedback()
+            if vectors is not None:
+                vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+            self.labels, self.texts, self.vectors, self.version = labels, texts, vectors, version
+
+    def examples(self):
+        """(labels, unit vectors or None, version) of all reviewed emails"""
+        self._refresh()
+        return self.labels, self.vectors, self.version
+
+    def neighbours(self, embedding, k):
+        """[(cosine similarity, (primary, sub), example text)] of the k closest reviewed emails"""
+        self._refresh()
+        labels, texts, vectors = self.labels, self.texts, self.vectors
+        if vectors is None or embedding is None:
+            return []
+        query = np.asarray(embedding, dtype="float32")
+        similarities = vectors @ (query / np.linalg.norm(query))
+        top = np.argsort(-similarities)[:k]
+        return [(float(similarities[i]), labels[i], texts[i]) for i in top]
+
+    def classify(self, embedding, threshold=FEEDBACK_KNN_THRESHOLD):
+        """Label propagation from close reviewed emails; a ClassificationResult, or None if not confident.
+
+        Each neighbour above FEEDBACK_MIN_SIMILARITY votes for its label with its
+        similarity. Confidence is the winning label's share of the votes,
+        discounted until FEEDBACK_MIN_NEIGHBOURS agree (a near-exact repeat of a
+        reviewed email counts as enough on its own).
+        """
+        result = self._classify(embedding, threshold)
+        with self.stats_lock:
+            self._stats["checked"] += 1
+            self._stats["answered"] += int(result is not None)
+        return result
+
+    def _classify(self, embedding, threshold):
+        close = [(score, label) for score, label, _ in self.neighbours(embedding, FEEDBACK_KNN_K)
+                 if score >= FEEDBACK_MIN_SIMILARITY]
+        if not close:
+            return None
+        votes, supporters, best = {}, {}, {}
+        for score, label in close:
+            votes[label] = votes.get(label, 0.0) + score
+            supporters[label] = supporters.get(label, 0) + 1
+            best[label] = max(best.get(label, 0.0), score)
+        label = max(votes, key=votes.get)
+        support = 1.0 if best[label] >= FEEDBACK_EXACT_SIMILARITY else min(1.0, supporters[label] / FEEDBACK_MIN_NEIGHBOURS)
+        confidence = votes[label] / sum(votes.values()) * support
+        if confidence < threshold:
+            return None
+        primary, sub = label
+        return ClassificationResult(
+            primary_request_type=primary,
+            sub_request_type=sub,
+            confidence_score=round(confidence, 2),
+            additional_request_types=None,
+            reason=f"Matched {supporters[label]} reviewed email(s) (closest similarity {best[label]:.2f})",
+        )
+
+    def few_shot_examples(self, embedding, k=FEEDBACK_FEW_SHOT_K):
+        """The closest reviewed emails (above FEEDBACK_MIN_SIMILARITY) formatted for the
+        classification prompt, or "None"
+        """
+        # Unrelated examples would mislead the classifier and split its cache key for nothing
+        examples = [
+            f"Email:\n{text}\nPrimary Request Type: {primary}\nSub Request Type: {sub or 'N/A'}"
+            for score, (primary, sub), text in self.neighbours(embedding, k)
+            if score >= FEEDBACK_MIN_SIMILARITY
+        ]
+        return "\n\n".join(examples) or "None"
+
+    def stats(self):
+        """Emails checked and answered by the kNN in this process"""
+        with self.stats_lock:
+            checked = self._stats["checked"]
+            return {**self._stats, "fraction": self._stats["answered"] / checked if checked else 0.0}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_feedback_index():
+    """Return the process-wide feedback index over the shared state store"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from state_store import get_state_store
+                _index = FeedbackIndex(get_state_store())
+    return _index
@@ -0,0 +1,133 @@
+# field_extractor.py - Deterministic regex extraction of amounts, dates, references and deal/borrower lines
+import datetime
+import re
+
+from config import DATE_DAY_FIRST
+
+EXTRACTED_FIELDS = ("deal_name", "borrower", "amount", "payment_date", "transaction_reference")
+
+MULTIPLIERS = {"k": 1e3, "thousand": 1e3, "m": 1e6, "mm": 1e6, "million": 1e6, "b": 1e9, "bn": 1e9, "billion": 1e9}
+MONTHS = {month: i for i, month in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1
+)}
+
+_CURRENCY_CODE = r"\b(?:USD|EUR|GBP|CAD|CHF|JPY)\b"
+_AMOUNT = (
+    r"(?P<number>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)"
+    r"(?:\s?(?P<multiplier>MM|BN|thousand|million|billion|[KMB])\b)?"
+)
+AMOUNT_PATTERN = re.compile(r"(?P<currency>" + _CURRENCY_CODE + r"|[$€£])\s?" + _AMOUNT, re.IGNORECASE)  # USD 1,000.00
+AMOUNT_SUFFIX_PATTERN = re.compile(r"\b" + _AMOUNT + r"\s?(?P<currency>" + _CURRENCY_CODE + r")", re.IGNORECASE)  # 1,000.00 USD
+_MONTH = r"(?P<month_name>jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)"
+DATE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r"\b(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})\b",                        # 2025-02-04
+    r"\b(?P<day>\d{1,2})[-/ ]" + _MONTH + r"\.?[-/ ,]+(?P<year>\d{4}|\d{2})\b",          # 04-Feb-2025, 4 February 2025
+    r"\b" + _MONTH + r"\.?\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?,?\s+(?P<year>\d{4})\b",   # Feb 4, 2025
+    r"\b(?P<first>\d{1,2})[-/.](?P<second>\d{1,2})[-/.](?P<year>\d{4}|\d{2})\b",       # 11-4-2022, 02/04/25
+)]
+REFERENCE_PATTERN = re.compile(
+    r"\b(?:ref(?:erence)?|transaction|txn|trade|invoice|cusip|confirmation)"
+    r"(?:\s*(?:no\.?|number|id|ref(?:erence)?))?\s*[:#]?\s*(?P<value>[A-Z0-9][A-Z0-9\-/_.]{3,}[A-Z0-9])",
+    re.IGNORECASE,
+)
+LABEL_PATTERNS = {
+    "deal_name": re.compile(r"^[\s*_>]*(?:deal(?:\s+name)?|facility\s+name)\s*:[ \t]*(?P<value>[^\n]*?)[\s*_]*$",
+                            re.IGNORECASE | re.MULTILINE),
+    "borrower": re.compile(r"^[\s*_>]*borrower(?:\s+name)?\s*:[ \t]*(?P<value>[^\n]*?)[\s*_]*$",
+                           re.IGNORECASE | re.MULTILINE),
+}
+# Words just before an amount/date that mark it as the one being paid or taking effect
+AMOUNT_CONTEXT = re.compile(r"\b(amount|pay(?:ment|able)?|remit|fund(?:ing)?|due|total|(?:increased|decreased|adjusted) to)\b", re.IGNORECASE)
+DATE_CONTEXT = re.compile(r"\b(effective|payment date|value date|due|settle(?:ment)?|pay(?:ment)? on|on or before)\b", re.IGNORECASE)
+CONTEXT_CHARS = 60
+
+
+def parse_amount(match):
+    """Amount of an AMOUNT_PATTERN or AMOUNT_SUFFIX_PATTERN match as a float ("$171.3MM" -> 171300000.0)"""
+    value = float(match.group("number").replace(",", ""))
+    multiplier = match.group("multiplier")
+    return value * MULTIPLIERS[multiplier.lower()] if multiplier else value
+
+
+def parse_date(match):
+    """ISO date of a DATE_PATTERNS match, or None if it is not a real date"""
+    groups = match.groupdict()
+    year = int(groups["year"])
+    year += 2000 if year < 100 else 0
+    if groups.get("month_name"):
+        month, day = MONTHS[groups["month_name"][:3].lower()], int(groups["day"])
+    elif groups.get("first"):
+        first, second = int(groups["first"]), int(groups["second"])
+        month, day = (second, first) if DATE_DAY_FIRST or first > 12 else (first, second)
+    else:
+        month, day = int(groups["month"]), int(groups["day"])
+    try:
+        return datetime.date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def _pick(candidates, text, context):
+    """Value of the first candidate with a context keyword just before it, else the first candidate"""
+    for start, value in candidates:
+        if context.search(text, max(0, start - CONTEXT_CHARS), start):
+            return value
+    return candidates[0][1] if candidates else None
+
+
+def find_amount(text):
+    prefixed = list(AMOUNT_PATTERN.finditer(text))
+    candidates = [(match.start(), parse_amount(match)) for match in prefixed]
+    taken = [match.span() for match in prefixed]
+    for match in AMOUNT_SUFFIX_PATTERN.finditer(text):
+        # "2025 USD 5,000": the currency belongs to the amount after it, not to the year
+        if not any(start < match.end() and match.start() < end for start, end in taken):
+            candidates.append((match.start(), parse_amount(match)))
+    return _pick(sorted(candidates), text, AMOUNT_CONTEXT)
+
+
+def find_date(text):
+    candidates, taken = [], []
+    for pattern in DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            # Patterns are ordered most to least specific; skip spans an earlier pattern already matched
+            if any(start < match.end() and match.start() < end for start, end in taken):
+                continue
+            taken.append(match.span())
+            date = parse_date(match)
+            if date:
+                candidates.append((match.start(), date))
+    return _pick(sorted(candidates), text, DATE_CONTEXT)
+
+
+def find_reference(text):
+    for match in REFERENCE_PATTERN.finditer(text):
+        value = match.group("value")
+        if any(char.isdigit() for char in value):
+            return value
+    return None
+
+
+def find_label(text, field):
+    for match in LABEL_PATTERNS[field].finditer(text):
+        value = match.group("value").strip(" *_")
+        if value:
+            return value
+    return None
+
+
+def extract_fields(email_text):
+    """Return the ExtractionResult fields found deterministically in the email, e.g.
+
+    {"deal_name": ..., "amount": 5542963.55, "payment_date": "2025-02-04"}
+
+    Fields that could not be found are left out, so the LLM only has to fill those.
+    """
+    fields = {
+        "deal_name": find_label(email_text, "deal_name"),
+        "borrower": find_label(email_text, "borrower"),
+        "amount": find_amount(email_text),
+        "payment_date": find_date(email_text),
+        "transaction_reference": find_reference(email_text),
+    }
+    return {field: value for field, value in fields.items() if value is not None}
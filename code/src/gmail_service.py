@@ -1,159 +1,12 @@
-# # gmail_service.py - Gmail API integration
-# import os
-# import base64
-# import re
-# from googleapiclient.discovery import build
-# from google.oauth2.credentials import Credentials
-# from config import CREDENTIALS_FILE
-#
-#
-# def get_gmail_service():
-#     """Initialize and return Gmail API service"""
-#     creds = None
-#     if os.path.exists(CREDENTIALS_FILE):
-#         creds = Credentials.from_authorized_user_file(CREDENTIALS_FILE)
-#         return build("gmail", "v1", credentials=creds)
-#     return None
-#
-#
-# def save_email_attachments(service, message_id, attachments_dir="attachments"):
-#     """Fetch and store attachments from an email. Returns list of saved file paths."""
-#     attachment_paths = []
-#     try:
-#         # Ensure attachments directory exists
-#         os.makedirs(attachments_dir, exist_ok=True)
-#
-#         message = service.users().messages().get(userId="me", id=message_id).execute()
-#         payload = message.get("payload", {})
-#
-#         if "parts" in payload:
-#             for part in payload["parts"]:
-#                 if part.get("filename"):
-#                     attachment_id = part["body"].get("attachmentId")
-#                     if attachment_id:
-#                         attachment = service.users().messages().attachments().get(
-#                             userId="me", messageId=message_id, id=attachment_id
-#                         ).execute()
-#
-#                         file_data = base64.urlsafe_b64decode(attachment["data"])
-#                         file_path = os.path.join(attachments_dir, part["filename"])
-#
-#                         with open(file_path, "wb") as f:
-#                             f.write(file_data)
-#                         attachment_paths.append(file_path)
-#                         print(f"Saved: {file_path}")
-#     except Exception as e:
-#         print(f"Error fetching attachments: {e}")
-#
-#     return attachment_paths
-#
-#
-# def extract_email_address(sender):
-#     """Extract email address from sender string"""
-#     match = re.search(r"<(.*?)>", sender)
-#     return match.group(1) if match else sender
-#
-#
-# def get_email_body(payload):
-#     """Recursively extract email body from nested parts"""
-#     if "parts" in payload:
-#         for part in payload["parts"]:
-#             if part["mimeType"] == "text/plain":
-#                 return base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8", errors="ignore")
-#             elif part["mimeType"] == "text/html":
-#                 return base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8", errors="ignore")
-#             elif "parts" in part:
-#                 return get_email_body(part)  # Recursive call
-#     elif "body" in payload and "data" in payload["body"]:
-#         return base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8", errors="ignore")
-#     return "No content available"
-#
-#
-# def get_email_details(service, message_id):
-#     """Get detailed information about a specific email"""
-#     try:
-#         message = service.users().messages().get(userId="me", id=message_id).execute()
-#         payload = message["payload"]
-#         headers = payload["headers"]
-#
-#         # Extract email metadata
-#         subject = next((h["value"] for h in headers if h["name"] == "Subject"), "No Subject")
-#         sender = next((h["value"] for h in headers if h["name"] == "From"), "Unknown Sender")
-#         sender_email = extract_email_address(sender)
-#         date = next((h["value"] for h in headers if h["name"] == "Date"), "Unknown Date")
-#
-#         # Get full email body
-#         body = get_email_body(payload)
-#         snippet = message.get("snippet", "")
-#
-#         # Initialize email data
-#         email_data = {
-#             "id": message_id,
-#             "subject": subject,
-#             "from": sender_email,
-#             "date": date,
-#             "full_body": body.strip() if body else "No content available",
-#             "snippet": snippet
-#         }
-#
-#         return email_data
-#     except Exception as e:
-#         print(f"Error fetching email details: {e}")
-#         return None
-#
-#
-# def fetch_emails(service, max_results=50, label_ids=None):
-#     """Fetch emails from inbox (all emails, not just those with attachments)"""
-#     if not service:
-#         return []
-#
-#     try:
-#         query_params = {
-#             "userId": "me",
-#             "maxResults": max_results,
-#             "labelIds": label_ids if label_ids else ["INBOX"]  # Default to inbox
-#         }
-#
-#         response = service.users().messages().list(**query_params).execute()
-#         message_ids = response.get("messages", [])
-#         return [msg["id"] for msg in message_ids]
-#     except Exception as e:
-#         print(f"Error fetching emails: {e}")
-#         return []
-#
-#
-# def fetch_emails_after_id(service, last_processed_id=None, max_results=50):
-#     """Fetch emails after a specific email ID"""
-#     if not service:
-#         return []
-#
-#     try:
-#         query = ""
-#         if last_processed_id:
-#             # Get timestamp of the last processed email
-#             last_msg = service.users().messages().get(userId="me", id=last_processed_id).execute()
-#             last_internal_date = int(last_msg.get('internalDate', 0))
-#             # Fetch newer emails based on timestamp
-#             query = f"after:{last_internal_date // 1000}"
-#
-#         response = service.users().messages().list(
-#             userId="me",
-#             maxResults=max_results,
-#             q=query
-#         ).execute()
-#
-#         message_ids = response.get("messages", [])
-#         return [msg["id"] for msg in message_ids]
-#     except Exception as e:
-#         print(f"Error fetching emails: {e}")
-#         return []
 # gmail_service.py - Gmail API integration
 import os
 import base64
 import re
+import threading
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google.oauth2.credentials import Credentials
-from config import CREDENTIALS_FILE
+from config import CREDENTIALS_FILE, GMAIL_BATCH_SIZE
 
 
 def get_gmail_service():
@@ -165,32 +18,105 @@ def get_gmail_service():
     return None
 
 
-def save_email_attachments(service, message_id, attachments_dir="attachments"):
-    """Fetch and store attachments from an email. Returns list of saved file paths."""
+_thread_local = threading.local()
+
+
+def get_thread_gmail_service():
+    """Return a Gmail API service owned by the calling thread.
+
+    The underlying httplib2 transport is not thread-safe, so pipeline workers
+    must not share one service object.
+    """
+    if getattr(_thread_local, "service", None) is None:
+        _thread_local.service = get_gmail_service()
+    return _thread_local.service
+
+
+def batch_get_messages(service, message_ids, format="full", metadata_headers=None, batch_size=GMAIL_BATCH_SIZE):
+    """Fetch many messages with Gmail batch HTTP requests.
+
+    Groups messages().get calls into batches of up to batch_size, so each
+    message is downloaded exactly once. Use format="metadata" (optionally with
+    metadata_headers) when only headers are needed. Returns {message_id: message};
+    messages that failed to load are left out.
+    """
+    messages = {}
+    if not service or not message_ids:
+        return messages
+
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            print(f"Error fetching email {request_id}: {exception}")
+            return
+        messages[request_id] = response
+
+    unique_ids = list(dict.fromkeys(message_ids))
+    for start in range(0, len(unique_ids), batch_size):
+        batch = service.new_batch_http_request(callback=on_response)
+        for message_id in unique_ids[start:start + batch_size]:
+            params = {"userId": "me", "id": message_id, "format": format}
+            if format == "metadata" and metadata_headers:
+                params["metadataHeaders"] = metadata_headers
+            batch.add(service.users().messages().get(**params), request_id=message_id)
+        try:
+            batch.execute()
+        except Exception as e:
+            print(f"Error fetching email batch: {e}")
+
+    return messages
+
+
+def get_message(service, message_id, message=None):
+    """Return an already fetched message, or fetch it in full"""
+    if message is not None:
+        return message
+    return service.users().messages().get(userId="me", id=message_id).execute()
+
+
+def iter_attachment_parts(payload):
+    """Yield every payload part (at any depth) that carries a named attachment"""
+    for part in payload.get("parts", []):
+        if part.get("filename"):
+            yield part
+        if "parts" in part:
+            yield from iter_attachment_parts(part)
+
+
+def save_email_attachments(service, message_id, attachments_dir="attachments", message=None):
+    """Fetch and store attachments from an email. Returns list of saved file paths.
+
+    Files go to a per-message folder, so same-named attachments of emails
+    processed concurrently do not overwrite each other. Pass the already
+    fetched message to reuse its payload instead of fetching it again.
+    """
     attachment_paths = []
     try:
         # Ensure attachments directory exists
+        attachments_dir = os.path.join(attachments_dir, message_id)
         os.makedirs(attachments_dir, exist_ok=True)
 
-        message = service.users().messages().get(userId="me", id=message_id).execute()
+        message = get_message(service, message_id, message)
         payload = message.get("payload", {})
 
-        if "parts" in payload:
-            for part in payload["parts"]:
-                if part.get("filename"):
-                    attachment_id = part["body"].get("attachmentId")
-                    if attachment_id:
-                        attachment = service.users().messages().attachments().get(
-                            userId="me", messageId=message_id, id=attachment_id
-                        ).execute()
-
-                        file_data = base64.urlsafe_b64decode(attachment["data"])
-                        file_path = os.path.join(attachments_dir, part["filename"])
-
-                        with open(file_path, "wb") as f:
-                            f.write(file_data)
-                        attachment_paths.append(file_path)
-                        print(f"Saved: {file_path}")
+        for part in iter_attachment_parts(payload):
+            body = part.get("body", {})
+            if "data" in body:
+                # Small attachments are inlined in the payload
+                data = body["data"]
+            elif body.get("attachmentId"):
+                data = service.users().messages().attachments().get(
+                    userId="me", messageId=message_id, id=body["attachmentId"]
+                ).execute()["data"]
+            else:
+                continue
+
+            file_data = base64.urlsafe_b64decode(data)
+            file_path = os.path.join(attachments_dir, os.path.basename(part["filename"]))
+
+            with open(file_path, "wb") as f:
+                f.write(file_data)
+            attachment_paths.append(file_path)
+            print(f"Saved: {file_path}")
     except Exception as e:
         print(f"Error fetching attachments: {e}")
 
@@ -218,37 +144,48 @@ def get_email_body(payload):
     return "No content available"
 
 
-def get_email_details(service, message_id, attachments_dir="attachments"):
-    """Get complete email details including both emails with and without attachments"""
+def parse_email_message(message):
+    """Build the email data dict from a fetched message (attachments not saved yet)"""
+    payload = message["payload"]
+    headers = payload.get("headers", [])
+
+    # Extract email metadata
+    subject = next((h["value"] for h in headers if h["name"] == "Subject"), "No Subject")
+    sender = next((h["value"] for h in headers if h["name"] == "From"), "Unknown Sender")
+    sender_email = extract_email_address(sender)
+    date = next((h["value"] for h in headers if h["name"] == "Date"), "Unknown Date")
+    # Same across label copies and re-deliveries of one message; used for exact duplicate checks
+    message_id_header = next((h["value"].strip() for h in headers if h["name"].lower() == "message-id"), None)
+
+    # Get full email body
+    body = get_email_body(payload)
+    snippet = message.get("snippet", "")
+
+    return {
+        "id": message["id"],
+        "subject": subject,
+        "from": sender_email,
+        "date": date,
+        "full_body": body.strip() if body else "No content available",
+        "snippet": snippet,
+        "message_id": message_id_header,
+        "thread_id": message.get("threadId"),
+        "attachments": []
+    }
+
+
+def get_email_details(service, message_id, attachments_dir="attachments", message=None):
+    """Get complete email details including both emails with and without attachments
+
+    Pass a message from batch_get_messages to skip the per-message fetch.
+    """
     try:
-        message = service.users().messages().get(userId="me", id=message_id).execute()
-        payload = message["payload"]
-        headers = payload["headers"]
-
-        # Extract email metadata
-        subject = next((h["value"] for h in headers if h["name"] == "Subject"), "No Subject")
-        sender = next((h["value"] for h in headers if h["name"] == "From"), "Unknown Sender")
-        sender_email = extract_email_address(sender)
-        date = next((h["value"] for h in headers if h["name"] == "Date"), "Unknown Date")
-
-        # Get full email body
-        body = get_email_body(payload)
-        snippet = message.get("snippet", "")
-
-        # Initialize email data with basic information
-        email_data = {
-            "id": message_id,
-            "subject": subject,
-            "from": sender_email,
-            "date": date,
-            "full_body": body.strip() if body else "No content available",
-            "snippet": snippet,
-            "attachments": []
-        }
+        message = get_message(service, message_id, message)
+        email_data = parse_email_message(message)
 
         # Check for and save attachments if they exist
-        if "parts" in payload and any(part.get("filename") for part in payload["parts"]):
-            attachment_paths = save_email_attachments(service, message_id, attachments_dir)
+        if any(iter_attachment_parts(message["payload"])):
+            attachment_paths = save_email_attachments(service, message_id, attachments_dir, message)
             email_data["attachments"] = [{"path": path} for path in attachment_paths]
 
         return email_data
@@ -316,4 +253,60 @@ def fetch_new_emails_since(service, last_processed_date=None, max_results=100):
         return [msg["id"] for msg in messages]
     except Exception as e:
         print(f"Error fetching new emails: {e}")
-        return []
\ No newline at end of file
+        return []
+
+def get_current_history_id(service):
+    """Return the mailbox's current historyId"""
+    return service.users().getProfile(userId="me").execute()["historyId"]
+
+
+def fetch_history_since(service, start_history_id, label_id="INBOX"):
+    """Return (message_ids, latest_history_id) for messages added to a label since a checkpoint.
+
+    Raises HttpError 404 when the checkpoint is too old for the history API.
+    """
+    message_ids = []
+    request_params = {
+        "userId": "me",
+        "startHistoryId": start_history_id,
+        "historyTypes": ["messageAdded"],
+        "labelId": label_id,
+    }
+    response = service.users().history().list(**request_params).execute()
+    while True:
+        for history in response.get("history", []):
+            for added in history.get("messagesAdded", []):
+                message = added["message"]
+                if label_id in message.get("labelIds", [label_id]):
+                    message_ids.append(message["id"])
+        if "nextPageToken" not in response:
+            break
+        response = service.users().history().list(pageToken=response["nextPageToken"], **request_params).execute()
+
+    return list(dict.fromkeys(message_ids)), response.get("historyId", start_history_id)
+
+
+def sync_new_emails(service, start_history_id=None, max_results=100):
+    """Incremental sync: return (message_ids, history_id) for mail added since the checkpoint.
+
+    Without a checkpoint, or when it has expired, falls back to listing the
+    inbox and starts a fresh checkpoint.
+    """
+    if not service:
+        return [], start_history_id
+
+    try:
+        if start_history_id:
+            try:
+                return fetch_history_since(service, start_history_id)
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                print(f"History checkpoint {start_history_id} expired, falling back to full sync")
+
+        # Take the checkpoint before listing, so mail arriving meanwhile is picked up next time
+        history_id = get_current_history_id(service)
+        return fetch_all_emails(service, max_results=max_results), history_id
+    except Exception as e:
+        print(f"Error syncing emails: {e}")
+        return [], start_history_id
@@ -0,0 +1,162 @@
+# job_queue.py - Durable email processing queue with retries, backoff and a dead-letter list
+import random
+import re
+import time
+
+from config import (
+    JOB_MAX_ATTEMPTS, JOB_BACKOFF_BASE, JOB_BACKOFF_MAX, JOB_RATE_LIMIT_BACKOFF_FACTOR, JOB_LEASE_SECONDS
+)
+
+PENDING, RUNNING, SUCCEEDED, FAILED = "pending", "running", "succeeded", "failed"
+
+RATE_LIMIT_PATTERN = re.compile(r"rate.?limit|too many requests|\b429\b|quota|resource.?exhausted", re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    idempotency_key TEXT PRIMARY KEY,
+    email_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (state, next_attempt_at);
+"""
+
+
+def job_key(email_id):
+    """Idempotency key of the job processing one Gmail message"""
+    return f"process-email:{email_id}"
+
+
+def is_rate_limited(error):
+    return bool(RATE_LIMIT_PATTERN.search(str(error)))
+
+
+def backoff_delay(attempts, rate_limited=False):
+    """Seconds before the next attempt: exponential in attempts, with jitter, longer on rate limits"""
+    delay = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * 2 ** max(0, attempts - 1))
+    if rate_limited:
+        delay = min(JOB_BACKOFF_MAX, delay * JOB_RATE_LIMIT_BACKOFF_FACTOR)
+    # Jitter spreads retries out so throttled jobs do not all come back at once
+    return delay * random.uniform(0.5, 1.0)
+
+
+class JobQueue:
+    """Jobs live in the state store's database, so finishing a job and saving
+    its result are committed in the same transaction.
+
+    A job goes pending -> running -> succeeded, or back to pending with a
+    backoff after a failure, and to failed (the dead-letter list) after
+    JOB_MAX_ATTEMPTS attempts. Running jobs whose worker died are reclaimed
+    after JOB_LEASE_SECONDS.
+    """
+
+    def __init__(self, state_store, max_attempts=JOB_MAX_ATTEMPTS, lease_seconds=JOB_LEASE_SECONDS):
+        self.store = state_store
+        self.db = state_store.db
+        self.lock = state_store.lock
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        with self.lock:
+            self.db.executescript(SCHEMA)
+            self.db.commit()
+
+    def enqueue(self, email_ids):
+        """Add a pending job per email; emails that already have a job are left alone"""
+        now = time.time()
+        with self.store.transaction():
+            cursor = self.db.executemany(
+                """INSERT OR IGNORE INTO jobs (idempotency_key, email_id, state, next_attempt_at, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                [(job_key(email_id), email_id, PENDING, now, now, now) for email_id in email_ids],
+            )
+            return cursor.rowcount
+
+    def claim(self, limit):
+        """Mark up to limit due jobs as running and return their email IDs, oldest first"""
+        now = time.time()
+        with self.lock:
+            # IMMEDIATE takes the write lock up front, so two workers cannot claim the same job
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute(
+                    "UPDATE jobs SET state = ?, updated_at = ? WHERE state = ? AND updated_at < ?",
+                    (PENDING, now, RUNNING, now - self.lease_seconds),
+                )
+                rows = self.db.execute(
+                    """SELECT idempotency_key, email_id FROM jobs WHERE state = ? AND next_attempt_at <= ?
+                       ORDER BY next_attempt_at LIMIT ?""",
+                    (PENDING, now, limit),
+                ).fetchall()
+                self.db.executemany(
+                    "UPDATE jobs SET state = ?, attempts = attempts + 1, updated_at = ? WHERE idempotency_key = ?",
+                    [(RUNNING, now, key) for key, _ in rows],
+                )
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
+        return [email_id for _, email_id in rows]
+
+    def complete(self, email_id):
+        """Mark a job succeeded; inside a store transaction() it commits together with the result"""
+        with self.store.transaction():
+            self.db.execute(
+                "UPDATE jobs SET state = ?, last_error = NULL, updated_at = ? WHERE idempotency_key = ?",
+                (SUCCEEDED, time.time(), job_key(email_id)),
+            )
+
+    def fail(self, email_id, error):
+        """Schedule a retry with backoff, or move the job to the dead-letter list; returns the new state"""
+        now = time.time()
+        with self.store.transaction():
+            row = self.db.execute(
+                "SELECT attempts FROM jobs WHERE idempotency_key = ?", (job_key(email_id),)
+            ).fetchone()
+            attempts = row[0] if row else self.max_attempts
+            state = FAILED if attempts >= self.max_attempts else PENDING
+            self.db.execute(
+                "UPDATE jobs SET state = ?, next_attempt_at = ?, last_error = ?, updated_at = ? WHERE idempotency_key = ?",
+                (state, now + backoff_delay(attempts, is_rate_limited(error)), str(error), now, job_key(email_id)),
+            )
+        return state
+
+    def dead_letters(self):
+        """Jobs that ran out of attempts: [{"email_id", "attempts", "last_error", "updated_at"}]"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT email_id, attempts, last_error, updated_at FROM jobs WHERE state = ? ORDER BY updated_at DESC",
+                (FAILED,),
+            ).fetchall()
+        return [dict(zip(("email_id", "attempts", "last_error", "updated_at"), row)) for row in rows]
+
+    def retry_dead_letters(self):
+        """Give every failed job a fresh set of attempts; returns how many were requeued"""
+        now = time.time()
+        with self.store.transaction():
+            cursor = self.db.execute(
+                "UPDATE jobs SET state = ?, attempts = 0, next_attempt_at = ?, updated_at = ? WHERE state = ?",
+                (PENDING, now, now, FAILED),
+            )
+            return cursor.rowcount
+
+    def counts(self):
+        """Number of jobs per state"""
+        with self.lock:
+            rows = self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {PENDING: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0, **dict(rows)}
+
+
+_queue = None
+
+
+def get_job_queue():
+    """Return the process-wide job queue on the shared state store"""
+    global _queue
+    if _queue is None:
+        from state_store import get_state_store
+        _queue = JobQueue(get_state_store())
+    return _queue
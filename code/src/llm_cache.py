@@ -0,0 +1,108 @@
+# llm_cache.py - Persistent, content-addressed cache of LLM crew results
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from config import (
+    REQUEST_TYPES, LLM_CACHE_FILE, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES, LLM_PROMPT_VERSION
+)
+
+# Check the size bound every this many inserts rather than on each one
+EVICT_EVERY = 100
+
+
+def normalize_email_text(email_text):
+    """Collapse whitespace so re-sent or re-wrapped copies of an email share a key"""
+    return re.sub(r"\s+", " ", email_text or "").strip()
+
+
+def make_cache_key(task, model, email_text):
+    """Hash of everything that determines an LLM answer: task, model, prompt version, request types and text"""
+    material = json.dumps(
+        [task, model, LLM_PROMPT_VERSION, REQUEST_TYPES, normalize_email_text(email_text)],
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """SQLite-backed key/value store with a TTL and least-recently-used eviction"""
+
+    def __init__(self, path=LLM_CACHE_FILE, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.puts_since_eviction = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )"""
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used_at)")
+        self.db.commit()
+
+    def get(self, key):
+        """Return the cached value (a dict) or None, counting the hit or miss"""
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] > self.ttl:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.db.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.db.execute("UPDATE responses SET last_used_at = ? WHERE key = ?", (now, key))
+            self.db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """Store a JSON-serialisable value"""
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self.puts_since_eviction += 1
+            if self.puts_since_eviction >= EVICT_EVERY:
+                self._evict(now)
+            self.db.commit()
+
+    def _evict(self, now):
+        self.puts_since_eviction = 0
+        self.db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        self.db.execute(
+            """DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )""",
+            (self.max_entries,),
+        )
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Return the process-wide cache, opening it on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
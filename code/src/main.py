@@ -1,108 +1,42 @@
 import streamlit as st
+import sqlite3
 import time
-from extractor import extract_text_from_file
-from gmail_service import (
-    get_gmail_service, get_email_details, fetch_all_emails, save_email_attachments
-)
-from crew import process_email_with_crew
-from storage import (
-    save_last_processed_id, get_last_processed_id,
-    save_processed_emails, load_processed_emails
-)
+from state_store import get_state_store
+from job_queue import get_job_queue
+from worker import get_worker_stats, get_worker_status, request_sync
+from results_view import ResultsView
 from ui_styles import get_css_styles
-from config import MAX_EMAILS_TO_FETCH
+from config import JOB_MAX_ATTEMPTS, WORKER_STATUS_EVERY, AUTO_REFRESH_STATUS_EVERY, RESULTS_PAGE_SIZES
 import os
 from datetime import datetime
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
 
-email_store=[]
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")  # Lightweight embedding model
-dimension = 384  # Model embedding size
-index = faiss.IndexFlatL2(dimension)  # FAISS index
+# Read-only viewer: emails are fetched and classified by worker.py into the state store
+state_store = get_state_store()
+job_queue = get_job_queue()
 
-# Page configuration
-st.set_page_config(layout="wide", page_title="Loan Servicing Email Processor")
 
-# Ensure the attachments directory exists
-ATTACHMENTS_DIR = "../../venv/attachments"
-os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
+@st.cache_resource
+def get_results_view():
+    """Row summaries from the store plus a bounded LRU of opened emails, shared by every session"""
+    return ResultsView(state_store)
 
-# Initialize session state
-if "processed_emails" not in st.session_state:
-    try:
-        st.session_state["processed_emails"] = load_processed_emails()
-    except:
-        st.session_state["processed_emails"] = set()
 
-if "email_data" not in st.session_state:
-    st.session_state["email_data"] = []
+results_view = get_results_view()
+
+# Page configuration
+st.set_page_config(layout="wide", page_title="Loan Servicing Email Processor")
 
-if "last_processed_time" not in st.session_state:
-    st.session_state["last_processed_time"] = None
+# Initialize session state
+if "loaded_at" not in st.session_state:
+    st.session_state["loaded_at"] = time.time()
 
 if "auto_refresh" not in st.session_state:
     st.session_state["auto_refresh"] = False
 
-# Initialize Gmail service
-gmail_service = get_gmail_service()
-if not gmail_service:
-    st.error("❌ Gmail API authentication failed. Please check your credentials.")
-    st.stop()
-
-
-def fetch_and_process_emails():
-    """Fetch and process all emails, regardless of attachments."""
-    with st.spinner("📥 Fetching emails..."):
-        # Get all emails from inbox
-        email_ids = fetch_all_emails(gmail_service, max_results=MAX_EMAILS_TO_FETCH)
-
-        if not email_ids:
-            st.info("No emails found in inbox.")
-            return
-
-        total_emails = len(email_ids)
-        processed_count = 0
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-
-        for email_id in email_ids:
-            if email_id in st.session_state["processed_emails"]:
-                continue
 
-            # Update progress
-            processed_count += 1
-            progress_bar.progress(processed_count / total_emails)
-            status_text.text(f"Processing email {processed_count} of {total_emails}")
-
-            email_data = get_email_details(gmail_service, email_id)
-            if not email_data:
-                continue
-
-            # Save attachments if they exist
-            attachment_paths = save_email_attachments(gmail_service, email_id, ATTACHMENTS_DIR)
-            email_data["attachments"] = [{"path": path} for path in attachment_paths]
-
-            # Process with CrewAI
-            result = process_email_with_crew(
-                email_data,
-                index,
-                email_store,
-                [e["email"] for e in st.session_state["email_data"][-10:]],
-
-            )
-
-            st.session_state["processed_emails"].add(email_id)
-            st.session_state["email_data"].insert(0, {"email": email_data, "result": result})
-            st.session_state["last_processed_time"] = datetime.now()
-
-            save_last_processed_id(email_id)
-            save_processed_emails(st.session_state["processed_emails"])
-
-        progress_bar.empty()
-        status_text.empty()
-        st.success(f"✅ Processed {processed_count} emails")
+def reload_results():
+    """Pick up whatever the worker stored since the page was loaded (the page is queried on every rerun)"""
+    st.session_state["loaded_at"] = time.time()
 
 
 # UI Header
@@ -114,18 +48,88 @@ st.markdown(get_css_styles(), unsafe_allow_html=True)
 # Control Panel
 col1, col2, col3 = st.columns([1, 1, 1])
 with col1:
-    if st.button("Fetch & Process All Emails"):
-        fetch_and_process_emails()
+    if st.button("Reload Results"):
+        reload_results()
+    st.caption("New mail is processed by `python worker.py daemon`.")
 with col2:
     auto_refresh = st.checkbox("Enable Auto-Refresh", value=st.session_state["auto_refresh"])
     st.session_state["auto_refresh"] = auto_refresh
 with col3:
-    refresh_interval = st.slider("Refresh Interval (seconds)", 10, 300, 60)
+    # The daemon runs the sync; the viewer never opens the vector store or runs the pipeline itself
+    if st.button("Sync Now"):
+        request_sync()
+        st.toast("Sync requested from the worker daemon")
+
+
+@st.fragment(run_every=AUTO_REFRESH_STATUS_EVERY if auto_refresh else None)
+def sync_status():
+    """Worker daemon status; reruns the page when the daemon stored new results"""
+    status = get_worker_status()
+    if not status or not status["running"] or time.time() - status["updated_at"] > 3 * WORKER_STATUS_EVERY:
+        st.caption("⚠️ Worker daemon is not running; start it with `python worker.py daemon`.")
+    else:
+        parts = []
+        if status["busy"]:
+            parts.append("⏳ Sync running")
+        elif status["next_run_at"]:
+            parts.append(f"Next sync in {max(0, status['next_run_at'] - time.time()):.0f}s")
+        if status["durations"]:
+            durations = status["durations"]
+            parts.append(f"last run {durations[-1]:.1f}s (avg {sum(durations) / len(durations):.1f}s over {len(durations)})")
+        if status["throttled_runs"]:
+            parts.append(f"backing off after {status['throttled_runs']} throttled runs")
+        if status["skipped"]:
+            parts.append(f"{status['skipped']} ticks skipped while a sync was running")
+        if parts:
+            st.caption(" · ".join(parts))
+        if status["last_error"]:
+            st.caption(f"⚠️ Last sync failed: {status['last_error']}")
+
+    if auto_refresh and get_worker_stats().get("last_run_at", 0) > st.session_state["loaded_at"]:
+        reload_results()
+        st.rerun()
+
+
+sync_status()
 
 st.divider()
 
+# Define your request types and subtypes at the top of your script (outside the loop)
+REQUEST_TYPES = ["Adjustment", "AU Transfer", "Closing Notice", "Commitment Change", "Fee Payment",
+                 "Money Movement Inbound", "Money Movement Outbound"]
+SUB_TYPES = ["Reallocation Fees", "Amendment Fees", "Reallocation Principal", "Cashless Roll",
+             "Decrease", "Increase", "Ongoing Fee", "Letter of Credit Fee", "Principal",
+             "Interest", "Principal+Interest", "Principal+Interest+Fee", "Timebound",
+             "Foreign Currency"]
+SORT_OPTIONS = {
+    "Newest first": "newest",
+    "Oldest first": "oldest",
+    "Highest confidence": "confidence_high",
+    "Lowest confidence": "confidence_low",
+    "Request type": "request_type",
+}
+DUPLICATE_OPTIONS = {"All": None, "Duplicates": True, "Unique": False}
+
+# Filters, sorting and paging run in SQL, so a rerun only loads and renders one page
+fcol1, fcol2, fcol3, fcol4, fcol5 = st.columns([3, 1, 1.5, 1.5, 1])
+filters = {
+    "request_types": fcol1.multiselect("Request Type", REQUEST_TYPES),
+    "duplicate": DUPLICATE_OPTIONS[fcol2.selectbox("Duplicate", list(DUPLICATE_OPTIONS))],
+    "min_confidence": fcol3.slider("Min Confidence", 0.0, 1.0, 0.0, 0.05),
+}
+sort = SORT_OPTIONS[fcol4.selectbox("Sort By", list(SORT_OPTIONS))]
+page_size = fcol5.selectbox("Page Size", RESULTS_PAGE_SIZES, index=1)
+
+total_results = results_view.count(**filters)
+page_count = max(1, -(-total_results // page_size))
+if st.session_state.get("page", 1) > page_count:
+    st.session_state["page"] = 1  # Filters narrowed the results below the current page
+page = st.number_input("Page", min_value=1, max_value=page_count, step=1, key="page")
+st.caption(f"{total_results} emails · page {page} of {page_count}")
+page_rows = results_view.page(**filters, sort=sort, limit=page_size, offset=(page - 1) * page_size)
+
 # Email Display Section
-if st.session_state["email_data"]:
+if page_rows:
     # Table Header
     st.markdown(
         """
@@ -171,100 +175,124 @@ if st.session_state["email_data"]:
 if "edit_mode" not in st.session_state:
     st.session_state["edit_mode"] = {}
 
+# Attachments whose bytes the user asked for; all others are never read from disk
+if "download_ready" not in st.session_state:
+    st.session_state["download_ready"] = set()
+
+# Per-email UI flags are only kept for the rows on screen, so the session does not grow with volume
+page_ids = {row["email_id"] for row in page_rows}
+for flags in (st.session_state.get("show_email_body", {}), st.session_state["edit_mode"]):
+    for key in [key for key in flags if key.removeprefix("edit_") not in page_ids]:
+        del flags[key]
+st.session_state["download_ready"] = {
+    key for key in st.session_state["download_ready"] if key.split("/", 1)[0] in page_ids
+}
+
+
+def render_attachment(email_id, attachment):
+    """A download button, reading the file only after the user asked to download it"""
+    file_name = os.path.basename(attachment["path"])
+    key = f"{email_id}/{file_name}"
+    if key not in st.session_state["download_ready"]:
+        if st.button(f"📎 {file_name}", key=f"prepare_{key}"):
+            st.session_state["download_ready"].add(key)
+            st.rerun()
+    elif not os.path.exists(attachment["path"]):
+        st.caption(f"⚠️ {file_name} is no longer on disk.")
+    else:
+        with open(attachment["path"], "rb") as file:
+            file_bytes = file.read()
+        st.download_button(label=f"⬇️ {file_name}", data=file_bytes, file_name=file_name,
+                           mime="application/octet-stream", key=f"download_{key}")
 
-# Define your request types and subtypes at the top of your script (outside the loop)
-REQUEST_TYPES = ["Adjustment", "AU Transfer", "Closing Notice", "Commitment Change", "Fee Payment",
-                 "Money Movement Inbound", "Money Movement Outbound"]
-SUB_TYPES = ["Reallocation Fees", "Amendment Fees", "Reallocation Principal", "Cashless Roll",
-             "Decrease", "Increase", "Ongoing Fee", "Letter of Credit Fee", "Principal",
-             "Interest", "Principal+Interest", "Principal+Interest+Fee", "Timebound",
-             "Foreign Currency"]
 
+for row in page_rows:
+    confidence = row["confidence_score"] or 0.0
+    primary_type = row["primary_request_type"]
+    sub_type = row["sub_request_type"] or ""
+    is_duplicate = bool(row["duplicate_flag"])  # True if duplicate, False otherwise
 
-for idx, item in enumerate(st.session_state["email_data"]):
-    email = item["email"]
-    result = item["result"]
+    email_id = row["email_id"]
 
-    if not result:
-        continue
+    if f"edit_{email_id}" not in st.session_state["edit_mode"]:
+        st.session_state["edit_mode"][f"edit_{email_id}"] = False
 
-    classification = result["classification"]
-    extraction = result["extraction"]
-    duplicate = result["duplicate"]
+    # Full body and result are only loaded for rows the user opens (an expander would load them for every row)
+    if st.toggle(f"{row['subject']}", key=f"details_{email_id}"):
+        with st.container(border=True):
+            item = results_view.details(email_id, row["updated_at"])
+            email, result = item["email"], item["result"]
+            classification = result["classification"]
+            extraction = result["extraction"]
+            duplicate = result["duplicate"]
 
-    confidence = classification.confidence_score
-    primary_type = classification.primary_request_type
-    sub_type = classification.sub_request_type or ""
-    is_duplicate = duplicate.duplicate_flag  # True if duplicate, False otherwise
+            st.write(f"**Date:** {email['date']}")
+            st.write(f"**From:** {email['from']}")
 
-    email_id = email['id']
+            if st.button(f"View Full Email", key=f"toggle_{email_id}"):
+                st.session_state["show_email_body"][email_id] = not st.session_state["show_email_body"].get(email_id, False)
 
-    if f"edit_{email_id}" not in st.session_state["edit_mode"]:
-        st.session_state["edit_mode"][f"edit_{email_id}"] = False
+            if st.session_state["show_email_body"].get(email_id, False):
+                st.write(email["full_body"])
+
+            if email["attachments"]:
+                st.write("**Attachments:**")
+                for attachment in email["attachments"]:
+                    render_attachment(email_id, attachment)
+                    if attachment.get("extraction_error"):
+                        st.caption(f"⚠️ Text extraction incomplete: {attachment['extraction_error']}")
 
-    with st.expander(f"{email['subject']}", expanded=False):
-        st.write(f"**Date:** {email['date']}")
-        st.write(f"**From:** {email['from']}")
-
-        if st.button(f"View Full Email", key=f"toggle_{idx}"):
-            st.session_state["show_email_body"][idx] = not st.session_state["show_email_body"].get(idx, False)
-
-        if st.session_state["show_email_body"].get(idx, False):
-            st.write(email["full_body"])
-
-        if email["attachments"]:
-            st.write("**Attachments:**")
-            for attachment in email["attachments"]:
-                file_name = os.path.basename(attachment["path"])
-                with open(attachment["path"], "rb") as file:
-                    file_bytes = file.read()
-                st.download_button(label=f"{file_name}", data=file_bytes, file_name=file_name, mime="application/octet-stream")
-
-        col1, col2, col3 = st.columns(3)
-
-        with col1:
-            st.write("Classification Details")
-            st.markdown(
-                f"""
-                - **Primary Request Type:** {primary_type}
-                - **Additional Request Type:** {classification.additional_request_types or "N/A"}
-                - **Sub Request Type:** {sub_type}
-                - **Confidence Score:** {confidence:.2f}
-                - **Classification Reason:** {classification.reason or "N/A"}
-                """,
-                unsafe_allow_html=True
-            )
-
-        with col2:
-            st.write("Extraction Details")
-            if extraction:
+            col1, col2, col3 = st.columns(3)
+
+            with col1:
+                st.write("Classification Details")
                 st.markdown(
                     f"""
-                    - **Deal Name:** {extraction.deal_name or "Unknown"}
-                    - **Borrower:** {extraction.borrower or "Unknown"}
-                    - **Amount:** {extraction.amount or "N/A"}
-                    - **Payment Date:** {extraction.payment_date or "N/A"}
-                    - **Transaction Reference:** {extraction.transaction_reference or "N/A"}
+                    - **Primary Request Type:** {primary_type}
+                    - **Additional Request Type:** {classification.additional_request_types or "N/A"}
+                    - **Sub Request Type:** {sub_type}
+                    - **Confidence Score:** {confidence:.2f}
+                    - **Classification Reason:** {classification.reason or "N/A"}
                     """,
                     unsafe_allow_html=True
                 )
-            else:
-                st.write("No extraction data available.")
-
-        with col3:
-            st.write("Duplicate Details")
-            st.markdown(
-                f"""
-                - **Duplicate:** {is_duplicate}
-                - **Reason:** {duplicate.duplicate_reason or "N/A"}
-                """,
-                unsafe_allow_html=True
-            )
+
+            with col2:
+                st.write("Extraction Details")
+                if extraction:
+                    st.markdown(
+                        f"""
+                        - **Deal Name:** {extraction.deal_name or "Unknown"}
+                        - **Borrower:** {extraction.borrower or "Unknown"}
+                        - **Amount:** {extraction.amount or "N/A"}
+                        - **Payment Date:** {extraction.payment_date or "N/A"}
+                        - **Transaction Reference:** {extraction.transaction_reference or "N/A"}
+                        """,
+                        unsafe_allow_html=True
+                    )
+                else:
+                    st.write("No extraction data available.")
+
+            with col3:
+                st.write("Duplicate Details")
+                st.markdown(
+                    f"""
+                    - **Duplicate:** {is_duplicate}
+                    - **Reason:** {duplicate.duplicate_reason or "N/A"}
+                    """,
+                    unsafe_allow_html=True
+                )
+                for matched_id, score in zip(duplicate.matched_email_ids, duplicate.scores):
+                    st.write(f"Matches **{matched_id}** (similarity {score:.2f})")
+
+            dropped_tokens = sum(stats["dropped_tokens"] for stats in result.get("prompt_stats", {}).values())
+            if dropped_tokens:
+                st.caption(f"✂️ {dropped_tokens} low-signal tokens were trimmed from the LLM prompts.")
 
     col1, col2, col3, col4, col5, col6 = st.columns([3, 2, 2, 1.5, 1.5, 2])  # Adjusted spacing
 
 
-    col1.text(email['subject'])
+    col1.text(row['subject'])
     is_editing = st.session_state["edit_mode"][f"edit_{email_id}"]
 
     if is_editing:
@@ -286,152 +314,71 @@ for idx, item in enumerate(st.session_state["email_data"]):
         btn_col1, btn_col2 = st.columns(2)
         with btn_col1:
             if st.button("✅", key=f"approve_{email_id}"):
-                pass  # Handle approval logic
+                # Approved labels become examples for the feedback classifier and the LLM prompt
+                try:
+                    state_store.save_feedback(email_id, primary_type, row["sub_request_type"], "approved")
+                    st.toast("Classification approved")
+                except KeyError as e:
+                    st.error(f"Could not save the approval: {e}")
 
         with btn_col2:
             if st.button("✏️", key=f"edit_btn_{email_id}"):
                 if st.session_state["edit_mode"][f"edit_{email_id}"]:
-                    st.session_state["email_data"][idx]["result"]["classification"].primary_request_type = st.session_state[f"edit_req_type_{email_id}"]
-                    st.session_state["email_data"][idx]["result"]["classification"].sub_request_type = st.session_state[f"edit_sub_req_{email_id}"]
+                    # Saved to the store, since the page is re-read from it on every rerun. The result is
+                    # shared with the details cache, so the edit goes into a copy and the cache only
+                    # changes (is invalidated) once the save succeeded.
+                    result = results_view.details(email_id, row["updated_at"])["result"]
+                    classification = result["classification"].model_copy(update={
+                        "primary_request_type": st.session_state[f"edit_req_type_{email_id}"],
+                        "sub_request_type": st.session_state[f"edit_sub_req_{email_id}"],
+                    })
+                    try:
+                        results_view.save_result(email_id, {**result, "classification": classification})
+                        state_store.save_feedback(
+                            email_id, classification.primary_request_type, classification.sub_request_type, "edited",
+                        )
+                    except (KeyError, sqlite3.Error) as e:
+                        st.error(f"Could not save the correction: {e}")
                 st.session_state["edit_mode"][f"edit_{email_id}"] = not st.session_state["edit_mode"][f"edit_{email_id}"]
                 st.rerun()
 
-#
-# for idx, item in enumerate(st.session_state["email_data"]):
-#     email = item["email"]
-#     result = item["result"]
-#
-#     if not result:
-#         continue
-#
-#     classification = result["classification"]
-#     extraction = result["extraction"]
-#     duplicate = result["duplicate"]
-#
-#     confidence = classification.confidence_score
-#     primary_type = classification.primary_request_type
-#     sub_type = classification.sub_request_type or ""
-#
-#     email_id = email['id']
-#
-#     # Initialize edit mode if not set
-#     if f"edit_{email_id}" not in st.session_state["edit_mode"]:
-#         st.session_state["edit_mode"][f"edit_{email_id}"] = False
-#
-#     with st.expander(f"{email['subject']}", expanded=False):
-#         st.write(f"**Date:** {email['date']}")
-#         st.write(f"**From:** {email['from']}")
-#
-#         # Toggle button for viewing full email body
-#         if st.button(f"View Full Email", key=f"toggle_{idx}"):
-#             st.session_state["show_email_body"][idx] = not st.session_state["show_email_body"].get(idx, False)
-#
-#         if st.session_state["show_email_body"].get(idx, False):
-#             st.write(email["full_body"])
-#
-#         # Display attachments with download links
-#         if email["attachments"]:
-#             st.write("**Attachments:**")
-#             for attachment in email["attachments"]:
-#                 file_name = os.path.basename(attachment["path"])
-#                 with open(attachment["path"], "rb") as file:
-#                     file_bytes = file.read()
-#                 st.download_button(label=f"{file_name}", data=file_bytes, file_name=file_name,
-#                                    mime="application/octet-stream")
-#
-#         # Extracted Data Display
-#         if extraction:
-#             st.write("Extracted Data")
-#             st.markdown(
-#                 f"""
-#                 - **Deal Name:** {extraction.deal_name or "Unknown"}
-#                 - **Borrower:** {extraction.borrower or "Unknown"}
-#                 - **Amount:** {extraction.amount or "N/A"}
-#                 - **Payment Date:** {extraction.payment_date or "N/A"}
-#                 - **Transaction Reference:** {extraction.transaction_reference or "N/A"}
-#                 - **Duplicate:** {duplicate.duplicate_flag or "N/A"}
-#                 - **Classificaton reason:** {classification.reason or "N/A"}
-#                 """,
-#                 unsafe_allow_html=True
-#             )
-#
-#         # Classification Details
-#         st.write("Classification Results")
-#         st.markdown(
-#             f"""
-#             - **Primary Request Type:** {primary_type}
-#             - **Sub Request Type:** {sub_type}
-#             - **Confidence Score:** {confidence:.2f}
-#             """,
-#             unsafe_allow_html=True
-#         )
-#
-#     col1, col2, col3, col4, col5 = st.columns([3, 2, 2, 1, 2])
-#
-#     col1.text(email['subject'])
-#
-#     # Get edit mode state
-#     is_editing = st.session_state["edit_mode"][f"edit_{email_id}"]
-#
-#     if is_editing:
-#         # Show dropdowns in edit mode
-#         current_primary_idx = REQUEST_TYPES.index(primary_type) if primary_type in REQUEST_TYPES else 0
-#         current_sub_idx = SUB_TYPES.index(sub_type) if sub_type in SUB_TYPES else 0
-#
-#         new_primary = col2.selectbox(
-#             "Request Type",
-#             options=REQUEST_TYPES,
-#             index=current_primary_idx,
-#             key=f"edit_req_type_{email_id}"
-#         )
-#
-#         new_sub = col3.selectbox(
-#             "Sub Request Type",
-#             options=SUB_TYPES,
-#             index=current_sub_idx,
-#             key=f"edit_sub_req_{email_id}"
-#         )
-#     else:
-#         # Show text in view mode
-#         col2.text_input(
-#             "Request Type",
-#             value=primary_type,
-#             key=f"req_type_{email_id}",
-#             disabled=True
-#         )
-#         col3.text_input(
-#             "Sub Request Type",
-#             value=sub_type,
-#             key=f"sub_req_{email_id}",
-#             disabled=True
-#         )
-#
-#     col4.text(f"{confidence:.2f}")
-#
-#     with col5:
-#         btn_col1, btn_col2 = st.columns(2)
-#         with btn_col1:
-#             if st.button("✅", key=f"approve_{email_id}"):
-#                 pass  # Handle approval logic
-#
-#         with btn_col2:
-#             if st.button("✏️", key=f"edit_btn_{email_id}"):
-#                 # Toggle edit mode
-#                 if st.session_state["edit_mode"][f"edit_{email_id}"]:
-#                     # Save the edited values
-#                     st.session_state["email_data"][idx]["result"]["classification"].primary_request_type = \
-#                     st.session_state[f"edit_req_type_{email_id}"]
-#                     st.session_state["email_data"][idx]["result"]["classification"].sub_request_type = st.session_state[
-#                         f"edit_sub_req_{email_id}"]
-#
-#                 # Toggle edit mode
-#                 st.session_state["edit_mode"][f"edit_{email_id}"] = not st.session_state["edit_mode"][
-#                     f"edit_{email_id}"]
-#                 st.rerun()  # Refresh UI to reflect changes
-#
 
 # Footer
 st.markdown("---")
-st.markdown(f"**Total emails processed:** {len(st.session_state['processed_emails'])}")
-if st.session_state["last_processed_time"]:
-    st.markdown(f"**Last processed at:** {st.session_state['last_processed_time'].strftime('%Y-%m-%d %H:%M:%S')}")
\ No newline at end of file
+st.markdown(f"**Total emails processed:** {state_store.count_processed()}")
+worker_stats = get_worker_stats()
+if worker_stats:
+    cache_stats = worker_stats["llm_cache"]
+    st.markdown(f"**LLM cache:** {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+    fast_stats = worker_stats["fast_path"]
+    st.markdown(
+        f"**Fast path:** {fast_stats['fast_path']} of {fast_stats['total']} emails classified without the LLM "
+        f"({fast_stats['fraction']:.0%})"
+    )
+    if "feedback_knn" in worker_stats:
+        knn_stats = worker_stats["feedback_knn"]
+        st.markdown(
+            f"**Feedback kNN:** {knn_stats['answered']} of {knn_stats['checked']} emails classified from reviewed emails "
+            f"({knn_stats['fraction']:.0%})"
+        )
+    if "dedup" in worker_stats:
+        dedup_stats = worker_stats["dedup"]
+        st.markdown(
+            f"**Dedup:** {dedup_stats['message_id'] + dedup_stats['content_hash']} exact and "
+            f"{dedup_stats['near_duplicate']} near duplicates of {dedup_stats['checked']} emails caught before embedding"
+        )
+job_counts = job_queue.counts()
+st.markdown(
+    f"**Job queue:** {job_counts['pending']} pending / {job_counts['running']} running / "
+    f"{job_counts['failed']} failed"
+)
+if job_counts["failed"]:
+    with st.expander(f"⚠️ {job_counts['failed']} emails failed after {JOB_MAX_ATTEMPTS} attempts"):
+        for job in job_queue.dead_letters():
+            st.write(f"**{job['email_id']}** ({job['attempts']} attempts): {job['last_error']}")
+        if st.button("Retry failed emails"):
+            job_queue.retry_dead_letters()
+            st.rerun()
+if worker_stats:
+    last_run_at = datetime.fromtimestamp(worker_stats["last_run_at"])
+    st.markdown(f"**Last processed at:** {last_run_at.strftime('%Y-%m-%d %H:%M:%S')}")
\ No newline at end of file
@@ -19,9 +19,20 @@ class ExtractionResult(BaseModel):
     transaction_reference: Optional[str] = None
 
 
+class DuplicateHit(BaseModel):
+    email_id: str
+    score: float
+    timestamp: float
+    deal_name: Optional[str] = None
+    borrower: Optional[str] = None
+    snippet: str = ""
+
+
 class DuplicateCheckResult(BaseModel):
     duplicate_flag: bool
     duplicate_reason: str
+    matched_email_ids: List[str] = Field(default_factory=list)
+    scores: List[float] = Field(default_factory=list)
 
 
 class ProcessedEmail(BaseModel):
@@ -33,4 +44,11 @@ class ProcessedEmail(BaseModel):
     snippet: str
     classification: Optional[ClassificationResult] = None
     extraction: Optional[ExtractionResult] = None
-    is_processed: bool = False
\ No newline at end of file
+    is_processed: bool = False
+
+
+class AttachmentExtraction(BaseModel):
+    path: str
+    text: str = ""
+    error: Optional[str] = None
+    complete: bool = True
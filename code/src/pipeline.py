@@ -0,0 +1,220 @@
+# pipeline.py - Staged, concurrent email processing engine
+import queue
+import threading
+import time
+
+from config import PIPELINE_CONCURRENCY, PIPELINE_QUEUE_SIZE, PIPELINE_BATCH_WAIT, EMBEDDING_BATCH_SIZE, DEDUP_ENABLED
+
+_STOP = object()
+
+
+class Stage:
+    """A named processing step served by its own pool of worker threads.
+
+    With batch_size > 1 the function receives a list of up to batch_size items
+    (waiting at most batch_wait seconds to fill it) and returns a list of the
+    same length, with None for dropped items.
+    """
+
+    def __init__(self, name, func, workers=1, batch_size=1, batch_wait=PIPELINE_BATCH_WAIT):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.batch_wait = batch_wait
+
+
+class Pipeline:
+    """Chain of stages connected by bounded queues.
+
+    Every stage function takes an item and returns it (usually updated in place),
+    or None to drop it. Stages run concurrently, so a batch costs roughly as long
+    as its slowest stage instead of the sum of all stages.
+    """
+
+    def __init__(self, stages, queue_size=PIPELINE_QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+        # Set when the consumer of the current run goes away; long stage work can watch it
+        self.cancelled = threading.Event()
+
+    def run(self, items):
+        """Push items through all stages and yield (item, error) as each one finishes.
+
+        Results are yielded on the calling thread, so it is safe to update
+        Streamlit widgets while iterating. error is None on success.
+        """
+        items = list(items)
+        if not items:
+            return
+
+        inboxes = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results = queue.Queue()
+        cancelled = self.cancelled = threading.Event()
+        threads = []
+
+        for position, stage in enumerate(self.stages):
+            outbox = inboxes[position + 1] if position + 1 < len(self.stages) else None
+            next_workers = self.stages[position + 1].workers if outbox is not None else 1
+            remaining = {"workers": stage.workers, "lock": threading.Lock()}
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(stage, inboxes[position], outbox, results, remaining, next_workers, cancelled),
+                    name=f"pipeline-{stage.name}-{n}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        feeder = threading.Thread(
+            target=self._feed, args=(items, inboxes[0], self.stages[0].workers, cancelled),
+            name="pipeline-feeder", daemon=True
+        )
+        feeder.start()
+
+        try:
+            while True:
+                result = results.get()
+                if result is _STOP:
+                    break
+                yield result
+        finally:
+            # Consumer went away early (error, st.stop, ...): let the workers drain quietly
+            cancelled.set()
+
+    @staticmethod
+    def _feed(items, inbox, workers, cancelled):
+        for item in items:
+            if cancelled.is_set():
+                break
+            inbox.put(item)
+        for _ in range(workers):
+            inbox.put(_STOP)
+
+    @staticmethod
+    def _take(stage, inbox):
+        """Block for the next item, then gather up to a full batch; returns (items, stopped)"""
+        item = inbox.get()
+        if item is _STOP:
+            return [], True
+        items = [item]
+        deadline = time.monotonic() + stage.batch_wait
+        while len(items) < stage.batch_size:
+            try:
+                item = inbox.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return items, True
+            items.append(item)
+        return items, False
+
+    @staticmethod
+    def _work(stage, inbox, outbox, results, remaining, next_workers, cancelled):
+        stopped = False
+        while not stopped:
+            items, stopped = Pipeline._take(stage, inbox)
+            if not items or cancelled.is_set():
+                continue
+            try:
+                outputs = stage.func(items) if stage.batch_size > 1 else [stage.func(items[0])]
+            except Exception as e:
+                for item in items:
+                    results.put((item, f"{stage.name} failed: {e}"))
+                continue
+            for item, output in zip(items, outputs):
+                if output is None:
+                    results.put((item, f"{stage.name} returned no result"))
+                elif outbox is None:
+                    results.put((output, None))
+                else:
+                    outbox.put(output)
+
+        # The last worker of a stage to finish tells the next stage to stop
+        with remaining["lock"]:
+            remaining["workers"] -= 1
+            is_last = remaining["workers"] == 0
+        if is_last:
+            target = outbox if outbox is not None else results
+            for _ in range(next_workers):
+                target.put(_STOP)
+
+
+def build_email_pipeline(vector_store, attachments_dir, concurrency=None):
+    """Wire the fetch -> dedup -> attachments -> embed -> classify stages for Gmail messages.
+
+    Items are dicts that start as {"id": <gmail message id>}, optionally with the
+    "message" already fetched by gmail_service.batch_get_messages, and collect
+    "email", "dedup", "email_text", "embedding", "duplicate_hits", "duplicate" and "result".
+    An exact duplicate of a stored email gets its result in the dedup stage and
+    passes through the later stages untouched; any dedup match skips the embedding.
+    """
+    from gmail_service import get_thread_gmail_service, get_email_details
+    from crew import build_email_text, check_duplicates, run_crews
+    from embeddings import encode
+    from dedup import EXACT_TIERS, duplicate_of, get_dedup_index
+    from state_store import get_state_store
+
+    limits = dict(PIPELINE_CONCURRENCY)
+    limits.update(concurrency or {})
+    dedup_index = get_dedup_index() if DEDUP_ENABLED else None
+    state_store = get_state_store()
+
+    def fetch(item):
+        service = get_thread_gmail_service()
+        # Reuses the batch-fetched payload for the body and the attachments
+        email_data = get_email_details(service, item["id"], attachments_dir, message=item.pop("message", None))
+        if not email_data:
+            return None
+        item["email"] = email_data
+        return item
+
+    def dedup(item):
+        match = dedup_index.check(item["email"])
+        if match is None:
+            return item
+        item["dedup"] = match
+        item["duplicate"], item["duplicate_hits"], item["embedding"] = duplicate_of(match), [], None
+        prior = state_store.get_email_data(match["email_id"]) if match["tier"] in EXACT_TIERS else None
+        if prior and prior["result"]:
+            # Same message or same content: the original's answers hold, no extraction or LLM call needed
+            item["result"] = {**prior["result"], "duplicate": item["duplicate"], "prompt_stats": {}}
+        return item
+
+    def extract(item):
+        if "result" in item:
+            return item
+        # Stops the attachment extraction processes if the run is abandoned
+        item["email_text"] = build_email_text(item["email"], pipeline.cancelled)
+        return item
+
+    def embed(items):
+        # One model call for the whole batch; each vector is reused for lookup and insert
+        pending = [item for item in items if "dedup" not in item]
+        embeddings = encode([item["email_text"] for item in pending]) if pending else []
+        for item, embedding in zip(pending, embeddings):
+            item["embedding"] = embedding
+            item["duplicate_hits"], item["duplicate"] = check_duplicates(
+                item["email_text"], vector_store, item["id"], embedding
+            )
+        return items
+
+    def classify(item):
+        if "result" in item:
+            return item
+        item["result"] = run_crews(
+            item["email_text"], item["duplicate_hits"], item["duplicate"], item["embedding"]
+        )
+        return item
+
+    stages = [
+        Stage("fetch", fetch, limits["fetch"]),
+        Stage("extract", extract, limits["extract"]),
+        Stage("embed", embed, limits["embed"], batch_size=EMBEDDING_BATCH_SIZE),
+        Stage("classify", classify, limits["classify"]),
+    ]
+    if DEDUP_ENABLED:
+        stages.insert(1, Stage("dedup", dedup, limits["dedup"]))
+    pipeline = Pipeline(stages)
+    return pipeline
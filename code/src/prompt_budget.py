@@ -0,0 +1,116 @@
+# prompt_budget.py - Fit email text into each model's prompt token budget
+import functools
+import re
+
+from config import (
+    CHARS_PER_TOKEN, MODEL_TOKEN_BUDGETS, DEFAULT_TOKEN_BUDGET, MODEL_TOKEN_ENCODINGS, DEFAULT_TOKEN_ENCODING,
+    APPROXIMATE_TOKEN_MARGIN
+)
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; fall back to a character estimate
+    tiktoken = None
+
+GAP_MARKER = "[...]"
+MAX_LINE_CHARS = 400  # Longer lines (e.g. flowed PDF text) are split so they can be kept piecewise
+
+# Lines worth keeping when an email has to be cut: headers, deal/borrower lines, amounts, dates, references
+HIGH_SIGNAL_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r"^\s*(subject|from|to|cc|date|sent|re|fwd?)\s*:",
+    r"^\s*-+\s*attachments\s*-+\s*$",
+    r"\b(deal(\s+name)?|borrower|facility|lender|agent|description|effective|due|value date|payment date)\b",
+    r"\b(reference|ref\.?|transaction|cusip|invoice)\b",
+    r"(usd|eur|gbp|cad|\$|€|£)\s?\d[\d,]*(\.\d+)?\s?(mm|m|k|bn)?\b",
+    r"\b\d{1,3}(,\d{3})+(\.\d+)?\b",
+    r"\b\d{1,2}[-/ ](\d{1,2}|[a-z]{3,9})[-/ ]\d{2,4}\b",
+)]
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model):
+    """(tiktoken encoding or None, exact) for a model.
+
+    Models tiktoken knows by name ("openai/gpt-4o") get their own encoding;
+    others use MODEL_TOKEN_ENCODINGS (or DEFAULT_TOKEN_ENCODING) as an
+    approximation, and without tiktoken there is no encoding at all.
+    """
+    if tiktoken is None:
+        return None, False
+    try:
+        return tiktoken.encoding_for_model((model or "").split("/")[-1]), True
+    except KeyError:
+        pass
+    try:
+        return tiktoken.get_encoding(MODEL_TOKEN_ENCODINGS.get(model, DEFAULT_TOKEN_ENCODING)), False
+    except Exception:  # Encoding files cannot be downloaded (offline)
+        return None, False
+
+
+def count_tokens(text, model=None):
+    """Number of tokens in text for the model (tiktoken encoding, otherwise estimated from its length)"""
+    if not text:
+        return 0
+    encoding, _ = get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def get_token_budget(model):
+    """The model's budget, less APPROXIMATE_TOKEN_MARGIN when its tokens are not counted exactly"""
+    budget = MODEL_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+    _, exact = get_encoding(model)
+    return budget if exact else int(budget * APPROXIMATE_TOKEN_MARGIN)
+
+
+def split_long_line(line):
+    """Split a line longer than MAX_LINE_CHARS at whitespace"""
+    while len(line) > MAX_LINE_CHARS:
+        cut = line.rfind(" ", 0, MAX_LINE_CHARS)
+        cut = cut if cut > 0 else MAX_LINE_CHARS
+        yield line[:cut]
+        line = line[cut:].lstrip()
+    yield line
+
+
+def is_high_signal(line):
+    return any(pattern.search(line) for pattern in HIGH_SIGNAL_PATTERNS)
+
+
+def fit_to_budget(email_text, model):
+    """Trim email text to the model's token budget, keeping the high-signal lines first.
+
+    Returns (text, stats) where stats has the original token count, the tokens
+    kept and the tokens dropped. Kept lines stay in their original order, and
+    each run of dropped lines is replaced by a gap marker.
+    """
+    budget = get_token_budget(model)
+    total = count_tokens(email_text, model)
+    if total <= budget:
+        return email_text, {"model": model, "tokens": total, "kept_tokens": total, "dropped_tokens": 0}
+
+    lines = [piece for line in email_text.splitlines() for piece in split_long_line(line)]
+    costs = [count_tokens(line, model) + 1 for line in lines]
+    # High-signal lines first, then everything else from the top of the email down
+    order = [i for i, line in enumerate(lines) if is_high_signal(line)]
+    order += [i for i, line in enumerate(lines) if not is_high_signal(line)]
+
+    marker_cost = count_tokens(GAP_MARKER, model) + 1
+    keep = set()
+    used = marker_cost
+    for i in order:
+        # Reserve room for the gap marker that may follow this line
+        if costs[i] and used + costs[i] + marker_cost <= budget:
+            keep.add(i)
+            used += costs[i] + marker_cost
+
+    trimmed = []
+    for i, line in enumerate(lines):
+        if i in keep:
+            trimmed.append(line)
+        elif not trimmed or trimmed[-1] != GAP_MARKER:
+            trimmed.append(GAP_MARKER)
+    text = "\n".join(trimmed)
+    kept = count_tokens(text, model)
+    return text, {"model": model, "tokens": total, "kept_tokens": kept, "dropped_tokens": max(0, total - kept)}
@@ -0,0 +1,49 @@
+# results_view.py - Bounded LRU view over the state store for the dashboard
+import collections
+import threading
+
+from config import RESULTS_DETAIL_CACHE_SIZE
+
+
+class ResultsView:
+    """Table rows come straight from the store as small summaries; full emails
+    and results are loaded only when a row is opened, and the most recently
+    opened ones are kept in a bounded LRU shared by every session.
+
+    Details are cached per (email_id, updated_at), so a result rewritten by the
+    worker or by an edit is never served stale.
+    """
+
+    def __init__(self, store, max_entries=RESULTS_DETAIL_CACHE_SIZE):
+        self.store = store
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.details_cache = collections.OrderedDict()
+
+    def count(self, **filters):
+        return self.store.count_results(**filters)
+
+    def page(self, **query):
+        """Summary rows of one page (see StateStore.query_result_summaries)"""
+        return self.store.query_result_summaries(**query)
+
+    def details(self, email_id, updated_at=None):
+        """{"email": ..., "result": ...} for one email, from the LRU or the store"""
+        key = (email_id, updated_at)
+        with self.lock:
+            if key in self.details_cache:
+                self.details_cache.move_to_end(key)
+                return self.details_cache[key]
+        item = self.store.get_email_data(email_id)
+        with self.lock:
+            self.details_cache[key] = item
+            while len(self.details_cache) > self.max_entries:
+                self.details_cache.popitem(last=False)
+        return item
+
+    def save_result(self, email_id, result):
+        """Persist an edited result; the next summary carries a new updated_at, so the old entry is not reused"""
+        self.store.save_result(email_id, result)
+        with self.lock:
+            for key in [key for key in self.details_cache if key[0] == email_id]:
+                del self.details_cache[key]
@@ -0,0 +1,148 @@
+# scheduler.py - Background interval scheduler with jitter, throttling backoff and skip-if-running
+import collections
+import random
+import threading
+import time
+
+from config import SCHEDULER_JITTER, SCHEDULER_MAX_BACKOFF
+from job_queue import is_rate_limited
+
+
+def is_throttled(error):
+    """True for Gmail quota errors (HTTP 429 / 403 rateLimitExceeded) and LLM provider rate limits"""
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status == 429 or (status == 403 and "ratelimitexceeded" in str(error).lower()):
+        return True
+    return is_rate_limited(error)
+
+
+class Scheduler:
+    """Runs job() every interval seconds on a background thread.
+
+    Each delay gets +/- jitter (a fraction of the delay), so several workers
+    do not hit Gmail in lockstep. After a throttled run (the job raised a
+    throttling error, or returned a dict with a non-zero "rate_limited") the
+    delay doubles per consecutive throttled run, up to max_backoff. A tick
+    that comes while the previous run is still going is skipped.
+    """
+
+    def __init__(self, job, interval, jitter=SCHEDULER_JITTER, max_backoff=SCHEDULER_MAX_BACKOFF, name="scheduler"):
+        self.job = job
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.name = name
+        self.lock = threading.Lock()
+        self.run_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.stopping = False
+        self.next_run_at = None
+        self.throttled_runs = 0
+        self.skipped = 0
+        self.last_started_at = None
+        self.last_finished_at = None
+        self.last_error = None
+        self.last_result = None
+        self.durations = collections.deque(maxlen=20)
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive() and not self.stopping
+
+    @property
+    def busy(self):
+        return self.run_lock.locked()
+
+    def start(self, run_now=True):
+        with self.lock:
+            if self.running:
+                return
+            self.stopping = False
+            self.wakeup.clear()
+            self.next_run_at = time.time() if run_now else time.time() + self._delay()
+            self.thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stop scheduling; a run in progress finishes on its own"""
+        with self.lock:
+            self.stopping = True
+            self.next_run_at = None
+            self.wakeup.set()
+
+    def trigger(self):
+        """Run now instead of at the next scheduled time (skipped if a run is in progress)"""
+        with self.lock:
+            if not self.running:
+                return
+            self.next_run_at = time.time()
+            self.wakeup.set()
+
+    def _delay(self):
+        delay = self.interval
+        if self.throttled_runs:
+            delay = min(self.max_backoff, delay * 2 ** self.throttled_runs)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _loop(self):
+        while True:
+            with self.lock:
+                if self.stopping:
+                    return
+                wait = self.next_run_at - time.time()
+            if wait > 0:
+                self.wakeup.wait(wait)
+                self.wakeup.clear()
+                continue
+            self._tick()
+
+    def _tick(self):
+        with self.lock:
+            self.next_run_at = time.time() + self._delay()
+        if not self.run_lock.acquire(blocking=False):
+            self.skipped += 1
+            return
+        # The run gets its own thread so a long sync never delays or stacks up the ticks
+        threading.Thread(target=self._run, name=f"{self.name}-run", daemon=True).start()
+
+    def _run(self):
+        started = time.monotonic()
+        self.last_started_at = time.time()
+        throttled = False
+        try:
+            self.last_result = self.job()
+            self.last_error = None
+            throttled = isinstance(self.last_result, dict) and bool(self.last_result.get("rate_limited"))
+        except Exception as e:
+            print(f"Scheduled run failed: {e}")
+            self.last_error = str(e)
+            throttled = is_throttled(e)
+        finally:
+            self.durations.append(time.monotonic() - started)
+            self.last_finished_at = time.time()
+            self.run_lock.release()
+
+        with self.lock:
+            previous = self.throttled_runs
+            self.throttled_runs = self.throttled_runs + 1 if throttled else 0
+            if self.throttled_runs != previous and self.next_run_at is not None:
+                # Reschedule from now with the new backoff
+                self.next_run_at = time.time() + self._delay()
+
+    def status(self):
+        """Snapshot for display: times are epoch seconds, durations in seconds (most recent last)"""
+        with self.lock:
+            return {
+                "running": self.running,
+                "busy": self.busy,
+                "interval": self.interval,
+                "next_run_at": self.next_run_at if self.running else None,
+                "throttled_runs": self.throttled_runs,
+                "skipped": self.skipped,
+                "last_started_at": self.last_started_at,
+                "last_finished_at": self.last_finished_at,
+                "last_error": self.last_error,
+                "last_result": self.last_result,
+                "durations": list(self.durations),
+            }
@@ -0,0 +1,394 @@
+# state_store.py - Transactional SQLite (WAL) store for processed emails, results and sync checkpoints
+import contextlib
+import glob
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from config import STATE_DB_FILE, STATE_BUSY_TIMEOUT, FEEDBACK_EXAMPLE_CHARS
+from models import ClassificationResult, ExtractionResult, DuplicateCheckResult
+
+# Files written by the old storage.py, imported once into the store
+LEGACY_PROCESSED_EMAILS_FILE = "processed_emails.pickle"
+LEGACY_CHECKPOINT_FILES = {"last_processed_id": "last_processed_id.txt", "last_history_id": "last_history_id.txt"}
+LEGACY_EMAIL_DATA_PATTERN = "email_data_*.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed_emails (
+    email_id TEXT PRIMARY KEY,
+    processed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS emails (
+    email_id TEXT PRIMARY KEY,
+    subject TEXT,
+    sender TEXT,
+    date TEXT,
+    data TEXT NOT NULL,
+    stored_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    email_id TEXT PRIMARY KEY,
+    primary_request_type TEXT,
+    sub_request_type TEXT,
+    confidence_score REAL,
+    duplicate_flag INTEGER,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS feedback (
+    email_id TEXT PRIMARY KEY,
+    primary_request_type TEXT NOT NULL,
+    sub_request_type TEXT,
+    action TEXT NOT NULL,
+    example_text TEXT,
+    embedding BLOB,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY,
+    value TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS emails_stored_at ON emails (stored_at);
+CREATE INDEX IF NOT EXISTS results_request_type ON results (primary_request_type, sub_request_type);
+CREATE INDEX IF NOT EXISTS results_duplicate ON results (duplicate_flag);
+CREATE INDEX IF NOT EXISTS results_confidence ON results (confidence_score);
+"""
+
+# ORDER BY clauses for query_results
+RESULT_SORTS = {
+    "newest": "emails.stored_at DESC",
+    "oldest": "emails.stored_at ASC",
+    "confidence_high": "results.confidence_score DESC, emails.stored_at DESC",
+    "confidence_low": "results.confidence_score ASC, emails.stored_at DESC",
+    "request_type": "results.primary_request_type, results.sub_request_type, emails.stored_at DESC",
+}
+
+
+def _result_filters(request_types=None, duplicate=None, min_confidence=None):
+    """WHERE clause and parameters over the indexed results columns"""
+    clauses, params = [], []
+    if request_types:
+        clauses.append(f"results.primary_request_type IN ({','.join('?' * len(request_types))})")
+        params.extend(request_types)
+    if duplicate is not None:
+        clauses.append("results.duplicate_flag = ?")
+        params.append(int(duplicate))
+    if min_confidence:
+        clauses.append("results.confidence_score >= ?")
+        params.append(min_confidence)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def result_to_json(result):
+    """Serialise a run_crews result dict (pydantic models inside) to JSON"""
+    return json.dumps({
+        key: value.model_dump() if hasattr(value, "model_dump") else value
+        for key, value in result.items()
+    })
+
+
+def result_from_json(data):
+    """Inverse of result_to_json"""
+    result = json.loads(data)
+    for key, model in (("classification", ClassificationResult), ("extraction", ExtractionResult),
+                       ("duplicate", DuplicateCheckResult)):
+        if result.get(key) is not None:
+            result[key] = model(**result[key])
+    return result
+
+
+class StateStore:
+    """Processed IDs, email metadata, results and checkpoints in one SQLite database.
+
+    The worker and the viewer are separate processes writing to the same file,
+    so write transactions are kept short: every write method commits before it
+    returns, and writes that belong together (an email's result and its job
+    state) share one transaction(). Nothing holds the write lock while an
+    email is being extracted or classified.
+    """
+
+    def __init__(self, path=STATE_DB_FILE, busy_timeout=STATE_BUSY_TIMEOUT):
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")  # Durable at each WAL checkpoint; safe against corruption
+        self.db.executescript(SCHEMA)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(emails)")}
+        if "embedding" not in columns:
+            # Added for the feedback classifier; older databases get the column on open
+            self.db.execute("ALTER TABLE emails ADD COLUMN embedding BLOB")
+        self.db.commit()
+        self.migrate_legacy_files()
+
+    # -- writes --
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Hold the lock and commit the writes made in the block when the outermost block ends
+
+        Blocks nest; an exception rolls the outermost transaction back.
+        """
+        with self.lock:
+            self.depth += 1
+            try:
+                yield self.db
+            except BaseException:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.db.rollback()
+                raise
+            self.depth -= 1
+            if self.depth == 0:
+                self.db.commit()
+
+    def flush(self):
+        """Commit any open transaction"""
+        with self.lock:
+            if self.depth == 0:
+                self.db.commit()
+
+    def mark_processed(self, email_ids):
+        now = time.time()
+        with self.transaction():
+            self.db.executemany(
+                "INSERT OR IGNORE INTO processed_emails (email_id, processed_at) VALUES (?, ?)",
+                [(email_id, now) for email_id in email_ids],
+            )
+
+    def save_email(self, email, result=None, embedding=None):
+        """Store an email's metadata, its embedding and, if given, its result, and mark it processed"""
+        now = time.time()
+        blob = None if embedding is None else np.asarray(embedding, dtype="float32").tobytes()
+        with self.transaction():
+            self.db.execute(
+                """INSERT OR REPLACE INTO emails (email_id, subject, sender, date, data, embedding, stored_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (email["id"], email.get("subject"), email.get("from"), email.get("date"), json.dumps(email), blob, now),
+            )
+            if result:
+                self.save_result(email["id"], result)
+            self.db.execute(
+                "INSERT OR IGNORE INTO processed_emails (email_id, processed_at) VALUES (?, ?)", (email["id"], now)
+            )
+
+    def save_result(self, email_id, result):
+        """Insert or update the classification/extraction/duplicate result of an email"""
+        classification, duplicate = result.get("classification"), result.get("duplicate")
+        with self.transaction():
+            self.db.execute(
+                """INSERT OR REPLACE INTO results (email_id, primary_request_type, sub_request_type, confidence_score,
+                                                   duplicate_flag, data, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    email_id,
+                    classification.primary_request_type if classification else None,
+                    classification.sub_request_type if classification else None,
+                    classification.confidence_score if classification else None,
+                    int(duplicate.duplicate_flag) if duplicate else None,
+                    result_to_json(result),
+                    time.time(),
+                ),
+            )
+
+    def save_feedback(self, email_id, primary_request_type, sub_request_type, action):
+        """Record a reviewer's approval or correction with the email's embedding and a short example text
+
+        action is "approved" or "edited". A later review of the same email replaces the earlier one.
+        Raises KeyError if the email is not in the store.
+        """
+        with self.transaction():
+            row = self.db.execute("SELECT subject, data, embedding FROM emails WHERE email_id = ?", (email_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"Email {email_id} is not in the state store")
+            subject, data, embedding = row
+            body = json.loads(data).get("full_body") or ""
+            example_text = f"Subject: {subject}\n{body}"[:FEEDBACK_EXAMPLE_CHARS]
+            self.db.execute(
+                """INSERT OR REPLACE INTO feedback (email_id, primary_request_type, sub_request_type, action,
+                                                    example_text, embedding, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (email_id, primary_request_type, sub_request_type, action, example_text, embedding, time.time()),
+            )
+
+    def set_checkpoint(self, name, value):
+        """Store a checkpoint"""
+        with self.transaction():
+            self.db.execute(
+                "INSERT OR REPLACE INTO checkpoints (name, value, updated_at) VALUES (?, ?, ?)",
+                (name, None if value is None else str(value), time.time()),
+            )
+
+    # -- reads --
+
+    def get_checkpoint(self, name, default=None):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM checkpoints WHERE name = ?", (name,)).fetchone()
+        return row[0] if row and row[0] is not None else default
+
+    def is_processed(self, email_id):
+        with self.lock:
+            return self.db.execute(
+                "SELECT 1 FROM processed_emails WHERE email_id = ?", (email_id,)
+            ).fetchone() is not None
+
+    def filter_unprocessed(self, email_ids):
+        """The email_ids not processed yet, in their original order"""
+        email_ids = list(email_ids)
+        processed = set()
+        with self.lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(email_ids), 500):
+                chunk = email_ids[start:start + 500]
+                processed.update(row[0] for row in self.db.execute(
+                    f"SELECT email_id FROM processed_emails WHERE email_id IN ({','.join('?' * len(chunk))})", chunk
+                ))
+        return [email_id for email_id in email_ids if email_id not in processed]
+
+    def processed_ids(self):
+        with self.lock:
+            return {row[0] for row in self.db.execute("SELECT email_id FROM processed_emails")}
+
+    def count_processed(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM processed_emails").fetchone()[0]
+
+    def load_email_data(self, limit=None):
+        """Stored emails with their results, newest first: [{"email": ..., "result": ...}]"""
+        with self.lock:
+            rows = self.db.execute(
+                """SELECT emails.data, results.data FROM emails LEFT JOIN results USING (email_id)
+                   ORDER BY emails.stored_at DESC LIMIT ?""",
+                (-1 if limit is None else limit,),
+            ).fetchall()
+        return [
+            {"email": json.loads(email), "result": result_from_json(result) if result else None}
+            for email, result in rows
+        ]
+
+    def count_results(self, request_types=None, duplicate=None, min_confidence=None):
+        """Number of emails with a result matching the filters"""
+        where, params = _result_filters(request_types, duplicate, min_confidence)
+        with self.lock:
+            return self.db.execute(f"SELECT COUNT(*) FROM results{where}", params).fetchone()[0]
+
+    def query_results(self, request_types=None, duplicate=None, min_confidence=None, sort="newest", limit=25, offset=0):
+        """One page of emails with results, filtered and sorted in SQL: [{"email": ..., "result": ...}]
+
+        sort is a RESULT_SORTS key. Only limit rows are read and parsed, so the
+        cost of a page does not depend on how many emails are stored.
+        """
+        where, params = _result_filters(request_types, duplicate, min_confidence)
+        with self.lock:
+            rows = self.db.execute(
+                f"""SELECT emails.data, results.data FROM results JOIN emails USING (email_id){where}
+                    ORDER BY {RESULT_SORTS[sort]} LIMIT ? OFFSET ?""",
+                params + [limit, offset],
+            ).fetchall()
+        return [{"email": json.loads(email), "result": result_from_json(result)} for email, result in rows]
+
+    def query_result_summaries(self, request_types=None, duplicate=None, min_confidence=None, sort="newest",
+                               limit=25, offset=0):
+        """Like query_results, but only the indexed columns needed for a table row (no JSON is parsed):
+        [{"email_id", "subject", "sender", "date", "primary_request_type", "sub_request_type",
+          "confidence_score", "duplicate_flag", "updated_at"}]
+        """
+        where, params = _result_filters(request_types, duplicate, min_confidence)
+        with self.lock:
+            cursor = self.db.execute(
+                f"""SELECT email_id, emails.subject, emails.sender, emails.date, results.primary_request_type,
+                           results.sub_request_type, results.confidence_score, results.duplicate_flag, results.updated_at
+                    FROM results JOIN emails USING (email_id){where}
+                    ORDER BY {RESULT_SORTS[sort]} LIMIT ? OFFSET ?""",
+                params + [limit, offset],
+            )
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def feedback_version(self):
+        """Changes whenever feedback is added or replaced (cheap check before reloading it)"""
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*), MAX(created_at) FROM feedback").fetchone()
+
+    def load_feedback(self):
+        """Reviewed emails that have an embedding: (labels [(primary, sub)], example texts, float32 matrix)"""
+        with self.lock:
+            rows = self.db.execute(
+                """SELECT primary_request_type, sub_request_type, example_text, embedding FROM feedback
+                   WHERE embedding IS NOT NULL ORDER BY created_at"""
+            ).fetchall()
+        labels = [(primary, sub) for primary, sub, _, _ in rows]
+        texts = [text for _, _, text, _ in rows]
+        vectors = np.vstack([np.frombuffer(blob, dtype="float32") for _, _, _, blob in rows]) if rows else None
+        return labels, texts, vectors
+
+    def get_email_data(self, email_id):
+        """The full stored email and its result, or None"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT emails.data, results.data FROM emails LEFT JOIN results USING (email_id) WHERE email_id = ?",
+                (email_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"email": json.loads(row[0]), "result": result_from_json(row[1]) if row[1] else None}
+
+    # -- migration --
+
+    def migrate_legacy_files(self):
+        """Import the old pickle/text/JSON files once, then rename them to *.migrated"""
+        migrated = []
+        # One transaction for the whole import
+        with self.transaction():
+            if os.path.exists(LEGACY_PROCESSED_EMAILS_FILE):
+                try:
+                    with open(LEGACY_PROCESSED_EMAILS_FILE, "rb") as f:
+                        self.mark_processed(sorted(pickle.load(f)))
+                    migrated.append(LEGACY_PROCESSED_EMAILS_FILE)
+                except Exception as e:
+                    print(f"Could not migrate {LEGACY_PROCESSED_EMAILS_FILE}: {e}")
+
+            for name, path in LEGACY_CHECKPOINT_FILES.items():
+                if os.path.exists(path):
+                    with open(path, "r") as f:
+                        value = f.read().strip()
+                    if value and self.get_checkpoint(name) is None:
+                        self.db.execute(
+                            "INSERT INTO checkpoints (name, value, updated_at) VALUES (?, ?, ?)", (name, value, time.time())
+                        )
+                    migrated.append(path)
+
+            for path in glob.glob(LEGACY_EMAIL_DATA_PATTERN):
+                try:
+                    with open(path, "r") as f:
+                        email_data = json.load(f)
+                    self.save_email(email_data["email"])
+                    migrated.append(path)
+                except Exception as e:
+                    print(f"Could not migrate {path}: {e}")
+
+        # Renamed only after the commit, so an interrupted migration is simply retried
+        for path in migrated:
+            os.replace(path, f"{path}.migrated")
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_state_store():
+    """Return the process-wide state store, opening (and migrating) it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = StateStore()
+    return _store
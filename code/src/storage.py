@@ -1,38 +1,30 @@
-# storage.py - Data persistence functions
-import json
-import os
-import pickle
-
-LAST_PROCESSED_ID_FILE = "last_processed_id.txt"
-PROCESSED_EMAILS_FILE = "processed_emails.pickle"
+# storage.py - Data persistence functions (backed by the SQLite state store)
+from state_store import get_state_store
 
 def save_last_processed_id(email_id):
     """Save the ID of the last processed email"""
-    with open(LAST_PROCESSED_ID_FILE, "w") as f:
-        f.write(email_id)
+    get_state_store().set_checkpoint("last_processed_id", email_id)
 
 def get_last_processed_id():
     """Get the ID of the last processed email"""
-    if not os.path.exists(LAST_PROCESSED_ID_FILE):
-        return None
-    with open(LAST_PROCESSED_ID_FILE, "r") as f:
-        return f.read().strip() or None
+    return get_state_store().get_checkpoint("last_processed_id")
+
+def save_last_history_id(history_id):
+    """Save the Gmail historyId checkpoint used for incremental sync"""
+    get_state_store().set_checkpoint("last_history_id", history_id)
+
+def get_last_history_id():
+    """Get the Gmail historyId checkpoint, or None before the first sync"""
+    return get_state_store().get_checkpoint("last_history_id")
 
 def save_processed_emails(processed_emails):
-    """Save the set of processed email IDs"""
-    with open(PROCESSED_EMAILS_FILE, "wb") as f:
-        pickle.dump(processed_emails, f)
+    """Save the set of processed email IDs (only IDs not stored yet are written)"""
+    get_state_store().mark_processed(list(processed_emails))
 
 def load_processed_emails():
     """Load the set of processed email IDs"""
-    if not os.path.exists(PROCESSED_EMAILS_FILE):
-        return set()
-    with open(PROCESSED_EMAILS_FILE, "rb") as f:
-        return pickle.load(f)
+    return get_state_store().processed_ids()
 
 def save_email_data(email_data):
-    """Save processed email data to a JSON file"""
-    email_id = email_data["email"]["id"]
-    filename = f"email_data_{email_id}.json"
-    with open(filename, "w") as f:
-        json.dump(email_data, f)
\ No newline at end of file
+    """Save processed email data (email metadata and its result)"""
+    get_state_store().save_email(email_data["email"], email_data.get("result"))
@@ -0,0 +1,299 @@
+# vector_store.py - Persistent FAISS index and email metadata for duplicate detection
+import glob
+import os
+import sqlite3
+import threading
+import time
+
+import faiss
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from ann_index import build_index, configure_search, is_approximate, min_training_size, normalize, search_reranked
+from config import (
+    EMBEDDING_DIMENSION, VECTOR_STORE_DIR, VECTOR_COMPACT_EVERY, VECTOR_STORE_TEXT_CHARS, VECTOR_MAX_SEGMENTS,
+    ANN_INDEX_KIND, ANN_REBUILD_GROWTH
+)
+
+INDEX_FILE = "ann.faiss"
+VECTORS_FILE = "vectors.f32"
+METADATA_FILE = "metadata.sqlite"
+LOCK_FILE = "writer.lock"
+SEGMENT_PATTERN = "segment-*.faiss"
+
+
+def lock_exclusive(lock_file):
+    """Take a non-blocking exclusive lock on an open file; False if another process holds it.
+
+    The lock goes away with the file handle, so a crashed writer never leaves it behind.
+    """
+    try:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+class VectorStore:
+    """Email embeddings that survive restarts.
+
+    Every (normalised) vector is appended to a raw log on disk, which is the
+    source for (re)building the ANN index. The built index is opened with
+    faiss.IO_FLAG_MMAP, so startup does not read every vector into memory. New
+    vectors go to a small exact delta index; every `compact_every` inserts the
+    delta is written out as a memory-mapped segment file, so compaction costs
+    O(delta) instead of rewriting the built index. Past VECTOR_MAX_SEGMENTS the
+    segments are merged into one, or the whole index is rebuilt once they hold
+    as many vectors as it does. Email metadata lives in a SQLite table keyed by
+    the FAISS id, so only the rows of actual hits are ever loaded.
+
+    Only one process may write to a store: the constructor takes an exclusive
+    lock on the directory and raises RuntimeError if another process holds it.
+
+    Similarities are exact cosine scores (inner product of unit vectors), higher
+    is closer; IVF-PQ candidates are re-scored with their vectors from the log.
+    """
+
+    def __init__(self, directory=VECTOR_STORE_DIR, dimension=EMBEDDING_DIMENSION,
+                 compact_every=VECTOR_COMPACT_EVERY, kind=ANN_INDEX_KIND, params=None):
+        self.directory = directory
+        self.dimension = dimension
+        self.compact_every = compact_every
+        self.kind = kind
+        self.params = params
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+        # Two writers would each index only their own inserts, and lose the other's on restart
+        self.lock_file = open(os.path.join(directory, LOCK_FILE), "w")
+        if not lock_exclusive(self.lock_file):
+            self.lock_file.close()
+            raise RuntimeError(f"Another process is already writing to the vector store in {directory}")
+
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.vectors_path = os.path.join(directory, VECTORS_FILE)
+        self.record_dtype = np.dtype([("id", "<i8"), ("vector", "<f4", (dimension,))])
+
+        self.db = sqlite3.connect(os.path.join(directory, METADATA_FILE), check_same_thread=False)
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS vectors (
+                vector_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                email_id TEXT,
+                created_at REAL NOT NULL,
+                text TEXT
+            )"""
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS vectors_email_id ON vectors (email_id)")
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(vectors)")}
+        for column in ("deal_name", "borrower"):
+            if column not in columns:
+                # Shown with duplicate hits; older stores get the columns on open
+                self.db.execute(f"ALTER TABLE vectors ADD COLUMN {column} TEXT")
+        self.db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.commit()
+
+        self._load()
+
+    def _get_state(self, key, default=None):
+        row = self.db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_state(self, **values):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+            [(key, str(value)) for key, value in values.items()],
+        )
+        self.db.commit()
+
+    def _read_vectors(self):
+        """Memory-map the vector log (ids are increasing), ignoring a torn last record"""
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        count = size // self.record_dtype.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=self.record_dtype)
+        return np.memmap(self.vectors_path, dtype=self.record_dtype, mode="r", shape=(count,))
+
+    def _target_kind(self, ntotal):
+        # Trained indexes need enough data; until then exact search is both cheap and better
+        return self.kind if ntotal >= min_training_size(self.kind, self.params) else "flat"
+
+    def _new_delta(self):
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+
+    def _segment_names(self):
+        names = self._get_state("segments", "")
+        return names.split(",") if names else []
+
+    def _open(self, path, kind):
+        return configure_search(faiss.read_index(path, faiss.IO_FLAG_MMAP), kind, self.params)
+
+    def _lookup(self, ids):
+        """Exact vectors of base-index ids, read from the log (ids are increasing)"""
+        return np.asarray(self.records["vector"][np.searchsorted(self.records["id"], ids)])
+
+    def _load(self):
+        records = self.records = self._read_vectors()
+        indexed_max_id = int(self._get_state("indexed_max_id", -1))
+        indexed_count = int(np.searchsorted(records["id"], indexed_max_id, side="right"))
+        built_kind = self._get_state("index_kind")
+        segment_paths = [os.path.join(self.directory, name) for name in self._segment_names()]
+
+        if (os.path.exists(self.index_path) and all(os.path.exists(path) for path in segment_paths)
+                and built_kind == self._target_kind(indexed_count)):
+            self.base = self._open(self.index_path, built_kind)
+            self.base_kind = built_kind
+            self.segments = [self._open(path, "flat") for path in segment_paths]
+            self.delta = self._new_delta()
+            pending = records[indexed_count:]
+            if len(pending):
+                self.delta.add_with_ids(np.ascontiguousarray(pending["vector"]), np.ascontiguousarray(pending["id"]))
+        else:
+            # First start, changed ANN_INDEX_KIND or missing index file: rebuild from the log
+            self.rebuild()
+
+    @property
+    def ntotal(self):
+        return self.base.ntotal + sum(segment.ntotal for segment in self.segments) + self.delta.ntotal
+
+    def add(self, embedding, email_id=None, text="", deal_name=None, borrower=None):
+        """Store one embedding with its email metadata and return its vector id"""
+        vector = normalize(embedding).reshape(1, self.dimension)
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO vectors (email_id, created_at, text, deal_name, borrower) VALUES (?, ?, ?, ?, ?)",
+                (email_id, time.time(), (text or "")[:VECTOR_STORE_TEXT_CHARS], deal_name, borrower),
+            )
+            self.db.commit()
+            vector_id = cursor.lastrowid
+
+            record = np.zeros(1, dtype=self.record_dtype)
+            record["id"] = vector_id
+            record["vector"] = vector
+            with open(self.vectors_path, "ab") as f:
+                record.tofile(f)
+            self.delta.add_with_ids(vector, np.array([vector_id], dtype="int64"))
+
+            if self.delta.ntotal >= self.compact_every:
+                self.compact()
+        return vector_id
+
+    def has_email(self, email_id):
+        """True if a vector for this email is already stored (e.g. on a retried job)"""
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM vectors WHERE email_id = ? LIMIT 1", (email_id,)).fetchone() is not None
+
+    def search(self, embedding, k=1):
+        """Return up to k (cosine similarity, metadata) pairs, most similar first"""
+        query = normalize(embedding).reshape(1, self.dimension)
+        with self.lock:
+            hits = []
+            for index in (self.base, *self.segments, self.delta):
+                if index.ntotal == 0:
+                    continue
+                if index is self.base and is_approximate(self.base_kind):
+                    # PQ scores are too rough to compare with the duplicate threshold
+                    scores, ids = search_reranked(index, query, k, self._lookup, self.params)
+                else:
+                    scores, ids = index.search(query, min(k, index.ntotal))
+                    scores, ids = scores[0], ids[0]
+                hits.extend((float(s), int(i)) for s, i in zip(scores, ids) if i >= 0)
+            hits.sort(reverse=True)
+            hits = hits[:k]
+            rows = self.get_metadata([vector_id for _, vector_id in hits])
+        return [(score, rows[vector_id]) for score, vector_id in hits if vector_id in rows]
+
+    def get_metadata(self, vector_ids):
+        """Return {vector_id: metadata dict} for the given ids"""
+        if not vector_ids:
+            return {}
+        placeholders = ",".join("?" * len(vector_ids))
+        with self.lock:
+            rows = self.db.execute(
+                f"""SELECT vector_id, email_id, created_at, text, deal_name, borrower
+                    FROM vectors WHERE vector_id IN ({placeholders})""",
+                list(vector_ids),
+            ).fetchall()
+        return {
+            row[0]: dict(zip(("vector_id", "email_id", "created_at", "text", "deal_name", "borrower"), row))
+            for row in rows
+        }
+
+    def compact(self):
+        """Write the delta out as a new segment, merging segments or rebuilding when the policy says so"""
+        with self.lock:
+            if self.delta.ntotal == 0:
+                return
+            ntotal = self.ntotal
+            built_size = int(self._get_state("built_size", 0))
+            target_kind = self._target_kind(ntotal)
+            retrain_due = min_training_size(target_kind, self.params) > 0 and ntotal >= built_size * ANN_REBUILD_GROWTH
+            unbuilt = ntotal - self.base.ntotal
+            too_many_segments = len(self.segments) >= VECTOR_MAX_SEGMENTS
+            if target_kind != self.base_kind or retrain_due or (too_many_segments and unbuilt >= self.base.ntotal):
+                self.rebuild()
+                return
+
+            ids = faiss.vector_to_array(self.delta.id_map)
+            names = self._segment_names()
+            if too_many_segments:
+                # Everything after the built index, read back from the log: O(unbuilt), never O(n)
+                records = self._read_vectors()
+                # Stores built before segments existed had everything indexed in the base
+                base_max_id = int(self._get_state("base_max_id", self._get_state("indexed_max_id", -1)))
+                first = int(np.searchsorted(records["id"], base_max_id, side="right"))
+                segment = build_index("flat", records["vector"][first:], records["id"][first:], self.params)
+                names = []
+            else:
+                segment = self.delta
+            name = f"segment-{int(ids.max())}.faiss"
+            self._write(segment, os.path.join(self.directory, name))
+            names.append(name)
+            self._set_state(indexed_max_id=int(ids.max()), segments=",".join(names))
+
+            self.segments = [self._open(os.path.join(self.directory, name), "flat") for name in names]
+            self.delta = self._new_delta()
+            self._remove_stale_segments(names)
+
+    def rebuild(self):
+        """Build a fresh index (training it if needed) from every vector in the log"""
+        with self.lock:
+            records = self.records = self._read_vectors()
+            kind = self._target_kind(len(records))
+            index = build_index(kind, records["vector"], records["id"], self.params)
+            indexed_max_id = int(records["id"][-1]) if len(records) else -1
+            self._write(index, self.index_path)
+            self._set_state(index_kind=kind, indexed_max_id=indexed_max_id, base_max_id=indexed_max_id,
+                            built_size=len(records), segments="")
+            del index
+
+            self.base = self._open(self.index_path, kind)
+            self.base_kind = kind
+            self.segments = []
+            self.delta = self._new_delta()
+            self._remove_stale_segments([])
+
+    @staticmethod
+    def _write(index, path):
+        # Write to a temporary file first so a crash never leaves a half-written index
+        tmp_path = path + ".tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _remove_stale_segments(self, keep):
+        # Segments folded into a merge or rebuild, or written just before a crash
+        for path in glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)):
+            if os.path.basename(path) not in keep:
+                os.remove(path)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+            self.lock_file.close()
@@ -0,0 +1,201 @@
+# worker.py - Headless fetch -> extract -> classify worker writing results to the state store
+#
+# Usage (from code/src):
+#   python worker.py once                 process new mail once and exit
+#   python worker.py daemon [--interval]  keep syncing every WORKER_INTERVAL seconds (see scheduler.py)
+# The Streamlit app (main.py) only reads what this worker stores; its "Sync Now" button asks
+# the daemon for a run through a checkpoint (see request_sync), so the daemon stays the only writer.
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+
+from config import MAX_EMAILS_TO_FETCH, SYNC_MODE, ATTACHMENTS_DIR, WORKER_INTERVAL, WORKER_STATUS_EVERY
+from state_store import get_state_store
+from job_queue import get_job_queue, is_rate_limited
+from storage import save_last_processed_id, save_last_history_id, get_last_history_id
+
+WORKER_STATS_CHECKPOINT = "worker_stats"
+WORKER_STATUS_CHECKPOINT = "worker_status"
+SYNC_REQUEST_CHECKPOINT = "sync_requested"
+
+_vector_store = None
+
+
+def get_vector_store():
+    """Open the on-disk duplicate index once per process"""
+    global _vector_store
+    if _vector_store is None:
+        from vector_store import VectorStore
+        _vector_store = VectorStore()
+    return _vector_store
+
+
+def run_once(gmail_service=None, max_emails=MAX_EMAILS_TO_FETCH, on_progress=None):
+    """Sync new mail, process every due job and store the results.
+
+    on_progress(done, total) is called after each email. Returns a summary
+    dict: new (emails queued), claimed, succeeded, failed, rate_limited
+    (failures caused by provider throttling, which make the scheduler back off)
+    and deduplicated (caught by the dedup checks before embedding).
+    """
+    from gmail_service import get_gmail_service, fetch_all_emails, batch_get_messages, sync_new_emails
+    from pipeline import build_email_pipeline
+
+    state_store = get_state_store()
+    job_queue = get_job_queue()
+    gmail_service = gmail_service or get_gmail_service()
+    if not gmail_service:
+        raise RuntimeError("Gmail API authentication failed. Please check your credentials.")
+
+    if SYNC_MODE == "incremental":
+        # Only mail added since the stored historyId checkpoint
+        email_ids, history_id = sync_new_emails(gmail_service, get_last_history_id(), max_emails)
+    else:
+        # Get all emails from inbox
+        email_ids, history_id = fetch_all_emails(gmail_service, max_results=max_emails), None
+
+    # New mail becomes pending jobs; jobs whose retry backoff has expired run along with it
+    new_count = job_queue.enqueue(state_store.filter_unprocessed(email_ids))
+    summary = {"new": new_count, "claimed": 0, "succeeded": 0, "failed": 0, "rate_limited": 0, "deduplicated": 0}
+    if history_id:
+        save_last_history_id(history_id)
+    pending_ids = job_queue.claim(max_emails)
+    summary["claimed"] = len(pending_ids)
+    if not pending_ids:
+        record_stats(summary)
+        return summary
+
+    # One batch HTTP request per 100 messages instead of a round trip per message
+    messages = batch_get_messages(gmail_service, pending_ids)
+
+    # Attachment download and parsing, embedding and the LLM crews overlap across emails
+    pipeline = build_email_pipeline(get_vector_store(), ATTACHMENTS_DIR)
+    items = ({"id": email_id, "message": messages.get(email_id)} for email_id in pending_ids)
+    last_email_id = None
+    for done, (item, error) in enumerate(pipeline.run(items), start=1):
+        if error:
+            # Retried later with backoff; after JOB_MAX_ATTEMPTS it lands in the dead-letter list
+            state = job_queue.fail(item["id"], error)
+            print(f"Error processing email {item['id']} ({state}): {error}")
+            summary["failed"] += 1
+            summary["rate_limited"] += int(is_rate_limited(error))
+        else:
+            # Result, processed flag and job state are committed together, once per email
+            with state_store.transaction():
+                state_store.save_email(item["email"], item["result"], item.get("embedding"))
+                job_queue.complete(item["id"])
+            summary["succeeded"] += 1
+            summary["deduplicated"] += int("dedup" in item)
+            last_email_id = item["id"]
+        if on_progress:
+            on_progress(done, len(pending_ids))
+
+    if last_email_id:
+        save_last_processed_id(last_email_id)
+    record_stats(summary)
+    return summary
+
+
+def record_stats(summary):
+    """Store run and LLM-avoidance counters so the viewer (another process) can show them"""
+    from dedup import get_dedup_index
+    from fast_classifier import fast_path_stats
+    from feedback_classifier import get_feedback_index
+    from llm_cache import get_llm_cache
+
+    state_store = get_state_store()
+    stats = json.loads(state_store.get_checkpoint(WORKER_STATS_CHECKPOINT, "{}"))
+    stats.update({
+        "last_run_at": time.time(),
+        "last_run": summary,
+        "pid": os.getpid(),
+        # Counters below are cumulative for the current worker process
+        "llm_cache": get_llm_cache().stats(),
+        "fast_path": fast_path_stats(),
+        "feedback_knn": get_feedback_index().stats(),
+        "dedup": get_dedup_index().stats(),
+    })
+    state_store.set_checkpoint(WORKER_STATS_CHECKPOINT, json.dumps(stats))
+
+
+def get_worker_stats():
+    """The stats stored by the last worker run, or {}"""
+    return json.loads(get_state_store().get_checkpoint(WORKER_STATS_CHECKPOINT, "{}"))
+
+
+def request_sync():
+    """Ask the running daemon for a run now (called by the viewer)"""
+    get_state_store().set_checkpoint(SYNC_REQUEST_CHECKPOINT, time.time())
+
+
+def publish_status(scheduler):
+    """Store the daemon's scheduler status; updated_at doubles as a heartbeat"""
+    status = scheduler.status()
+    status.update({"updated_at": time.time(), "pid": os.getpid()})
+    get_state_store().set_checkpoint(WORKER_STATUS_CHECKPOINT, json.dumps(status))
+
+
+def get_worker_status():
+    """The scheduler status last published by the daemon, or {}"""
+    return json.loads(get_state_store().get_checkpoint(WORKER_STATUS_CHECKPOINT, "{}"))
+
+
+def run_daemon(interval=WORKER_INTERVAL, max_emails=MAX_EMAILS_TO_FETCH):
+    """Run run_once on a Scheduler (jitter, throttling backoff) until SIGINT/SIGTERM.
+
+    Sync requests from the viewer are picked up within a second; the
+    scheduler status is published every WORKER_STATUS_EVERY seconds.
+    """
+    from scheduler import Scheduler
+
+    def job():
+        started = time.monotonic()
+        summary = run_once(max_emails=max_emails)
+        print(f"Worker run finished in {time.monotonic() - started:.1f}s: {summary}")
+        return summary
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    state_store = get_state_store()
+    # Requests made before the daemon started are covered by its first run
+    handled_request = float(state_store.get_checkpoint(SYNC_REQUEST_CHECKPOINT, 0))
+    scheduler = Scheduler(job, interval, name="worker")
+    scheduler.start()
+    published_at = 0
+    while not stop.wait(1):
+        requested = float(state_store.get_checkpoint(SYNC_REQUEST_CHECKPOINT, 0))
+        if requested > handled_request:
+            handled_request = requested
+            scheduler.trigger()
+        if time.time() - published_at >= WORKER_STATUS_EVERY:
+            publish_status(scheduler)
+            published_at = time.time()
+    scheduler.stop()
+    # Let a run in progress finish so its results are committed
+    while scheduler.busy:
+        time.sleep(0.5)
+    publish_status(scheduler)
+    state_store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch, extract and classify emails into the state store")
+    parser.add_argument("mode", choices=("once", "daemon"))
+    parser.add_argument("--interval", type=float, default=WORKER_INTERVAL, help="seconds between daemon runs")
+    parser.add_argument("--max-emails", type=int, default=MAX_EMAILS_TO_FETCH)
+    args = parser.parse_args()
+
+    if args.mode == "once":
+        print(run_once(max_emails=args.max_emails))
+        get_state_store().close()
+    else:
+        run_daemon(args.interval, args.max_emails)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import sqlite3
+
+import pytest
+
+from dedup import (
+    CONTENT_HASH, MASK_64, MESSAGE_ID, NEAR_DUPLICATE, DedupIndex, hamming, normalize_body, simhash,
+    simhash_bands, to_signed
+)
+from state_store import StateStore
+
+BODY = (
+    "Dear lenders, please be advised that the borrower Acme Holdings LLC has repaid USD 5,000,000.00 of principal "
+    "under the ABC Term Loan facility. Your share of the repayment will be remitted to your account on 04-Feb-2025. "
+    "The repayment was made in accordance with section 2.5 of the credit agreement dated 12 March 2021 and reduces the "
+    "outstanding principal of the term loan to USD 45,000,000.00. Interest accrued on the repaid amount up to the "
+    "repayment date will be paid together with the next scheduled interest payment at the end of the current interest "
+    "period. No action is required from the lenders. Please contact the agency desk with any questions about this notice."
+)
+
+
+def flip_bits(value, bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+@pytest.fixture
+def index(tmp_path):
+    store = StateStore(str(tmp_path / "state.sqlite"))
+    yield DedupIndex(store)
+    store.close()
+
+
+def email(email_id, body=BODY, message_id=None, thread_id=None, attachments=()):
+    return {
+        "id": email_id,
+        "full_body": body,
+        "message_id": message_id or f"<{email_id}@mail.example.com>",
+        "thread_id": thread_id,
+        "attachments": [{"path": str(path)} for path in attachments],
+    }
+
+
+def fingerprint(simhash_value, thread_id=None):
+    return {"message_id": None, "thread_id": thread_id, "content_hash": None, "attachments_hash": "none",
+            "simhash": simhash_value}
+
+
+def test_simhash_is_deterministic_and_skips_short_texts():
+    text = normalize_body(BODY)
+    assert simhash(text) == simhash(text)
+    assert 0 <= simhash(text) <= MASK_64
+    assert simhash("see attached") is None
+
+
+def test_simhash_small_edit_stays_close_and_other_text_is_far():
+    text = normalize_body(BODY)
+    edited = normalize_body(BODY.replace("04-Feb-2025", "05-Feb-2025"))
+    other = normalize_body(
+        "Please fund your share of the drawdown under the revolving credit facility by the funding date. "
+        "The outgoing wire in EUR must be sent to the account below before the cut-off time on the value date."
+    )
+    assert hamming(simhash(text), simhash(edited)) <= 5
+    assert hamming(simhash(text), simhash(other)) > 10
+
+
+def test_hamming():
+    assert hamming(0, 0) == 0
+    assert hamming(0b1011, 0b0001) == 2
+    assert hamming(MASK_64, 0) == 64
+    assert hamming(-1, 0) == 64  # signed values read back from SQLite
+
+
+def test_hashes_within_max_distance_share_a_band():
+    value = 0x0123456789ABCDEF
+    bits = [0, 11, 22, 33, 44]  # one flipped bit in five of the six bands
+    assert len(simhash_bands(value)) == 6
+    assert any(a == b for a, b in zip(simhash_bands(value), simhash_bands(flip_bits(value, bits))))
+
+
+@pytest.mark.parametrize("value", [0, 1, (1 << 63) - 1, 1 << 63, MASK_64])
+def test_signed_storage_round_trip(value):
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE t (v INTEGER)")
+    db.execute("INSERT INTO t VALUES (?)", (to_signed(value),))
+    stored = db.execute("SELECT v FROM t").fetchone()[0]
+    assert stored & MASK_64 == value
+    assert hamming(value, stored) == 0
+
+
+def test_normalize_body_drops_forward_and_reply_headers():
+    forwarded = (
+        "---------- Forwarded message ---------\n"
+        "From: Agent Bank <agency@bank.example.com>\n"
+        "Date: Tue, 4 Feb 2025 at 10:00\n"
+        "Subject: Repayment notice\n"
+        "To: Lender <ops@lender.example.com>\n"
+        "\n"
+        f"{BODY}\n"
+        "On Tue, 4 Feb 2025 at 09:00 Agent Bank wrote:\n"
+        "> earlier message\n"
+    )
+    assert normalize_body(forwarded) == normalize_body(BODY)
+
+
+def test_unrelated_emails_are_not_duplicates(index):
+    assert index.check(email("a")) is None
+    assert index.check(email("b", body="Thanks, see you tomorrow.")) is None
+    assert index.stats() == {"checked": 2, MESSAGE_ID: 0, CONTENT_HASH: 0, NEAR_DUPLICATE: 0}
+
+
+def test_tier_order(index):
+    index.check(email("a", message_id="<m1@x>"))
+    index.check(email("b", body=BODY.upper() + " Regards.", message_id="<m2@x>"))
+    # Same Message-ID as b, same body as a: the Message-ID wins
+    assert index.check(email("c", message_id="<m2@x>")) == {"tier": MESSAGE_ID, "email_id": "b", "distance": 0}
+    # Same body as a (and near b): the content hash wins
+    assert index.check(email("d")) == {"tier": CONTENT_HASH, "email_id": "a", "distance": 0}
+    match = index.check(email("e", body=BODY.replace("04-Feb-2025", "05-Feb-2025")))
+    assert match["tier"] == NEAR_DUPLICATE and match["email_id"] == "a" and 0 < match["distance"] <= 5
+
+
+def test_forward_is_a_content_hash_match(index):
+    index.check(email("a"))
+    forwarded = "---------- Forwarded message ---------\nFrom: Agent Bank\nSubject: Notice\n\n" + BODY
+    assert index.check(email("b", body=forwarded))["tier"] == CONTENT_HASH
+
+
+def test_attachments_are_part_of_the_match(index, tmp_path):
+    (tmp_path / "notice.pdf").write_bytes(b"notice v1")
+    (tmp_path / "copy.pdf").write_bytes(b"notice v1")
+    (tmp_path / "other.pdf").write_bytes(b"notice v2")
+    index.check(email("a", attachments=[tmp_path / "notice.pdf"]))
+    assert index.check(email("b", attachments=[tmp_path / "copy.pdf"]))["email_id"] == "a"
+    assert index.check(email("c", attachments=[tmp_path / "other.pdf"])) is None
+    near = BODY.replace("04-Feb-2025", "05-Feb-2025")
+    assert index.check(email("d", body=near, attachments=[tmp_path / "other.pdf"]))["email_id"] == "c"
+
+
+@pytest.mark.parametrize("value", [0x0123456789ABCDEF, 0xF123456789ABCDEF])  # second one is negative when stored
+@pytest.mark.parametrize("bits, matched", [
+    ([63, 0, 11, 22, 33], True),       # 5 bits: at SIMHASH_MAX_DISTANCE
+    ([63, 0, 11, 22, 33, 44], False),  # 6 bits: still shares band 5, rejected by the Hamming check
+])
+def test_near_miss_just_outside_the_threshold(index, value, bits, matched):
+    index._add("a", fingerprint(value))
+    match = index._find("b", fingerprint(flip_bits(value, bits)))
+    assert (match == {"tier": NEAR_DUPLICATE, "email_id": "a", "distance": len(bits)}) is matched
+
+
+def test_same_thread_uses_the_looser_threshold(index):
+    value = 0x0123456789ABCDEF
+    index._add("a", fingerprint(value, thread_id="t1"))
+    candidate = flip_bits(value, [0, 1, 11, 12, 22, 23, 33, 34])  # 8 bits, every band of the first four differs
+    assert index._find("b", fingerprint(candidate)) is None
+    assert index._find("b", fingerprint(candidate, thread_id="t1"))["distance"] == 8
+
+
+def test_fingerprints_survive_a_reopen(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    store = StateStore(path)
+    DedupIndex(store).check(email("a"))
+    store.close()
+    store = StateStore(path)
+    try:
+        match = DedupIndex(store).check(email("b", body=BODY.replace("04-Feb-2025", "05-Feb-2025")))
+        assert match["tier"] == NEAR_DUPLICATE and match["email_id"] == "a"
+    finally:
+        store.close()
+
+
+def test_retried_email_does_not_match_itself(index):
+    assert index.check(email("a")) is None
+    assert index.check(email("a")) is None
+    assert index.db.execute("SELECT COUNT(*) FROM simhash_bands WHERE email_id = 'a'").fetchone()[0] == 6
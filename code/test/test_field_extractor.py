@@ -0,0 +1,122 @@
+import pytest
+
+import field_extractor
+from field_extractor import (
+    AMOUNT_PATTERN, AMOUNT_SUFFIX_PATTERN, extract_fields, find_amount, find_date, find_reference, parse_amount
+)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("USD 5,542,963.55", 5542963.55),
+    ("$171.3MM", 171300000.0),
+    ("EUR 2.5 million", 2500000.0),
+    ("£750k", 750000.0),
+    ("USD 1.2bn", 1200000000.0),
+    ("$ 1,000", 1000.0),
+    ("CAD 12", 12.0),
+])
+def test_parse_amount(text, expected):
+    assert parse_amount(AMOUNT_PATTERN.search(text)) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1,000,000.00 USD", 1000000.0),
+    ("250 EUR", 250.0),
+    ("1.2 million GBP", 1200000.0),
+    ("5MM usd", 5000000.0),
+])
+def test_parse_amount_with_trailing_currency(text, expected):
+    assert parse_amount(AMOUNT_SUFFIX_PATTERN.search(text)) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Please remit 1,000,000.00 USD today.", 1000000.0),
+    ("Payment date 04-Feb-2025 USD 1,000.00", 1000.0),  # the year is not an amount in USD
+    ("Facility of USD 50,000,000.00. Payment amount: 5,542,963.55 USD.", 5542963.55),
+    ("Amount due: 750,000 EURO", None),  # not a currency code
+])
+def test_find_amount_with_trailing_currency(text, expected):
+    assert find_amount(text) == (pytest.approx(expected) if expected else None)
+
+
+@pytest.mark.parametrize("text", [
+    "5,542,963.55 without a currency",
+    "USDX 500",
+    "Facility 2025-02",
+])
+def test_amount_needs_a_currency(text):
+    assert find_amount(text) is None
+
+
+def test_amount_after_payment_keyword_wins():
+    text = "Facility size USD 50,000,000.00. Payment amount: USD 5,542,963.55 due today."
+    assert find_amount(text) == pytest.approx(5542963.55)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("04-Feb-2025", "2025-02-04"),
+    ("4 February 2025", "2025-02-04"),
+    ("Feb 4, 2025", "2025-02-04"),
+    ("February 4th 2025", "2025-02-04"),
+    ("2025-02-04", "2025-02-04"),
+    ("11-4-2022", "2022-11-04"),
+    ("02/04/25", "2025-02-04"),
+    ("13/04/2022", "2022-04-13"),  # first part cannot be a month, so it is the day
+])
+def test_find_date_month_first(text, expected):
+    assert find_date(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("11-4-2022", "2022-04-11"),
+    ("02/04/25", "2025-04-02"),
+    ("04-Feb-2025", "2025-02-04"),  # named months are never ambiguous
+    ("2025-02-04", "2025-02-04"),
+])
+def test_find_date_day_first(monkeypatch, text, expected):
+    monkeypatch.setattr(field_extractor, "DATE_DAY_FIRST", True)
+    assert find_date(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "31-Feb-2025",
+    "2025-13-01",
+    "13/13/2022",
+    "30 Feb 2024",
+    "Version 1.2.3",
+])
+def test_invalid_dates_are_ignored(text):
+    assert find_date(text) is None
+
+
+def test_date_after_payment_keyword_wins():
+    text = "Notice dated 01-Feb-2025. Payment date: 04-Feb-2025."
+    assert find_date(text) == "2025-02-04"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Reference: TXN-2025-00123", "TXN-2025-00123"),
+    ("Transaction ID #AB12345", "AB12345"),
+    ("Our ref 99887766", "99887766"),
+    ("Invoice no. INV/2025/77", "INV/2025/77"),
+    ("Please reference the attached notice", None),  # no digits: a word, not a reference
+])
+def test_find_reference(text, expected):
+    assert find_reference(text) == expected
+
+
+def test_extract_fields_leaves_out_missing_fields():
+    text = (
+        "Deal Name: ABC Term Loan\n"
+        "Borrower: Acme Holdings LLC\n"
+        "Please remit USD 5,542,963.55 on or before 04-Feb-2025.\n"
+        "Reference: TXN-884213\n"
+    )
+    assert extract_fields(text) == {
+        "deal_name": "ABC Term Loan",
+        "borrower": "Acme Holdings LLC",
+        "amount": pytest.approx(5542963.55),
+        "payment_date": "2025-02-04",
+        "transaction_reference": "TXN-884213",
+    }
+    assert extract_fields("Thanks, see you tomorrow.") == {}
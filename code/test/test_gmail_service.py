@@ -0,0 +1,225 @@
+import base64
+import json
+import re
+import urllib.parse
+from email.parser import Parser
+
+import httplib2
+import pytest
+from googleapiclient.discovery import build
+
+import gmail_service
+
+
+def b64(text):
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+class FakeGmailHttp:
+    """Local stand-in for the Gmail REST API, driven by the bundled discovery document.
+
+    Serves messages.get/list, messages.attachments.get, history.list, getProfile
+    and batch requests, and records every HTTP round trip and every message fetched.
+    """
+
+    def __init__(self, messages, attachments=None):
+        self.messages = messages
+        self.attachments = attachments or {}
+        self.history = []  # [(history_id, message_id)] in mailbox order
+        self.history_id = 100
+        self.oldest_history_id = 1
+        self.round_trips = []
+        self.message_gets = []
+
+    def add_message(self, message):
+        self.history_id += 1
+        self.messages[message["id"]] = message
+        self.history.append((self.history_id, message["id"]))
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.round_trips.append(uri)
+        if urllib.parse.urlparse(uri).path.startswith("/batch"):
+            return self._batch(body, headers)
+        status, payload = self._call(method, uri)
+        return httplib2.Response({"status": status, "content-type": "application/json"}), json.dumps(payload).encode()
+
+    def _call(self, method, uri):
+        path = urllib.parse.urlparse(uri).path
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(uri).query)
+        if path.endswith("/users/me/profile"):
+            return 200, {"emailAddress": "me@bank.example", "historyId": str(self.history_id)}
+        if path.endswith("/users/me/history"):
+            return self._history(query)
+        if path.endswith("/users/me/messages"):
+            return 200, {"messages": [{"id": message_id} for message_id in list(self.messages)[:int(query["maxResults"][0])]]}
+        match = re.search(r"/users/me/messages/([^/]+)/attachments/([^/]+)$", path)
+        if match:
+            return 200, {"data": self.attachments[match.group(2)]}
+        match = re.search(r"/users/me/messages/([^/]+)$", path)
+        if match and method == "GET":
+            message_id = match.group(1)
+            self.message_gets.append((message_id, query.get("format", ["full"])[0]))
+            if message_id not in self.messages:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            message = self.messages[message_id]
+            if query.get("format") == ["metadata"]:
+                wanted = query.get("metadataHeaders", [])
+                headers = [h for h in message["payload"]["headers"] if not wanted or h["name"] in wanted]
+                message = {"id": message_id, "threadId": message.get("threadId"), "payload": {"headers": headers}}
+            return 200, message
+        return 404, {"error": {"code": 404, "message": "Not Found"}}
+
+    def _history(self, query):
+        start = int(query["startHistoryId"][0])
+        if start < self.oldest_history_id:
+            return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+        records = [
+            {"id": str(history_id), "messagesAdded": [{"message": {"id": message_id, "labelIds": ["INBOX"]}}]}
+            for history_id, message_id in self.history if history_id > start
+        ]
+        offset = int(query.get("pageToken", ["0"])[0])
+        page = {"history": records[offset:offset + 2], "historyId": str(self.history_id)}
+        if offset + 2 < len(records):
+            page["nextPageToken"] = str(offset + 2)
+        return 200, page
+
+    def _batch(self, body, headers):
+        boundary = "batch_response_boundary"
+        request = Parser().parsestr(f"Content-Type: {headers['content-type']}\r\n\r\n{body}")
+        parts = []
+        for part in request.get_payload():
+            method, target = part.get_payload().split("\n", 1)[0].split(" ")[:2]
+            status, payload = self._call(method, target)
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{part['Content-ID'][1:-1]}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\n"
+                "Content-Type: application/json\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        content = "".join(parts) + f"--{boundary}--"
+        response = httplib2.Response({"status": 200, "content-type": f"multipart/mixed; boundary={boundary}"})
+        return response, content.encode()
+
+
+def make_message(message_id, subject, body, attachments=()):
+    parts = [{"mimeType": "text/plain", "body": {"data": b64(body)}}]
+    for filename, attachment_id in attachments:
+        parts.append({"mimeType": "application/pdf", "filename": filename, "body": {"attachmentId": attachment_id}})
+    return {
+        "id": message_id,
+        "threadId": f"thread-{message_id}",
+        "snippet": body[:20],
+        "payload": {
+            "mimeType": "multipart/mixed",
+            "headers": [
+                {"name": "Subject", "value": subject},
+                {"name": "From", "value": "Agent Bank <agent@bank.example>"},
+                {"name": "Date", "value": "Tue, 4 Feb 2025 10:00:00 +0000"},
+            ],
+            "parts": parts,
+        },
+    }
+
+
+@pytest.fixture
+def gmail():
+    messages = {
+        f"m{i}": make_message(f"m{i}", f"Notice {i}", f"Body of notice {i}")
+        for i in range(150)
+    }
+    messages["m7"] = make_message("m7", "Fee notice", "Letter of Credit Fee due", [("fee.pdf", "att-1")])
+    http = FakeGmailHttp(messages, attachments={"att-1": b64("%PDF-fake")})
+    service = build("gmail", "v1", http=http, static_discovery=True)
+    return service, http
+
+
+def test_batch_get_messages_groups_requests_by_batch_size(gmail):
+    service, http = gmail
+    ids = [f"m{i}" for i in range(150)]
+
+    messages = gmail_service.batch_get_messages(service, ids)
+
+    assert set(messages) == set(ids)
+    assert messages["m3"]["payload"]["headers"][0]["value"] == "Notice 3"
+    # 150 messages -> two batch round trips of 100 + 50
+    assert len(http.round_trips) == 2
+    assert all(urllib.parse.urlparse(uri).path.startswith("/batch") for uri in http.round_trips)
+    assert sorted(message_id for message_id, _ in http.message_gets) == sorted(ids)
+
+
+def test_batch_get_messages_fetches_duplicates_once_and_skips_failures(gmail):
+    service, http = gmail
+
+    messages = gmail_service.batch_get_messages(service, ["m1", "m1", "missing", "m2"])
+
+    assert set(messages) == {"m1", "m2"}
+    assert [message_id for message_id, _ in http.message_gets].count("m1") == 1
+
+
+def test_batch_get_messages_metadata_format(gmail):
+    service, http = gmail
+
+    messages = gmail_service.batch_get_messages(service, ["m1"], format="metadata", metadata_headers=["Subject"])
+
+    assert http.message_gets == [("m1", "metadata")]
+    assert messages["m1"]["payload"]["headers"] == [{"name": "Subject", "value": "Notice 1"}]
+
+
+def test_get_email_details_reuses_prefetched_message(gmail, tmp_path):
+    service, http = gmail
+    messages = gmail_service.batch_get_messages(service, ["m7"])
+    http.round_trips.clear()
+
+    email_data = gmail_service.get_email_details(service, "m7", str(tmp_path), message=messages["m7"])
+
+    assert email_data["subject"] == "Fee notice"
+    assert email_data["from"] == "agent@bank.example"
+    assert email_data["full_body"] == "Letter of Credit Fee due"
+    assert email_data["attachments"] == [{"path": str(tmp_path / "m7" / "fee.pdf")}]
+    assert (tmp_path / "m7" / "fee.pdf").read_bytes() == b"%PDF-fake"
+    # Only the attachment body is downloaded; the message itself is not fetched again
+    assert len(http.round_trips) == 1
+    assert "/attachments/att-1" in http.round_trips[0]
+
+
+def test_get_email_details_without_prefetch_fetches_once(gmail, tmp_path):
+    service, http = gmail
+
+    email_data = gmail_service.get_email_details(service, "m7", str(tmp_path))
+
+    assert email_data["id"] == "m7"
+    assert [message_id for message_id, _ in http.message_gets] == ["m7"]
+
+
+def test_sync_without_checkpoint_lists_inbox_and_starts_checkpoint(gmail):
+    service, http = gmail
+
+    message_ids, history_id = gmail_service.sync_new_emails(service, None, max_results=10)
+
+    assert len(message_ids) == 10
+    assert history_id == "100"
+
+
+def test_sync_pulls_only_messages_added_since_checkpoint(gmail):
+    service, http = gmail
+    for i in range(5):
+        http.add_message(make_message(f"new{i}", f"New {i}", "Fresh notice"))
+
+    message_ids, history_id = gmail_service.sync_new_emails(service, "102", max_results=10)
+
+    assert message_ids == ["new2", "new3", "new4"]
+    assert history_id == "105"
+    assert not any(urllib.parse.urlparse(uri).path.endswith("/messages") for uri in http.round_trips)
+
+
+def test_sync_falls_back_to_full_list_when_checkpoint_expired(gmail):
+    service, http = gmail
+    http.oldest_history_id = 50
+    http.add_message(make_message("new0", "New", "Fresh notice"))
+
+    message_ids, history_id = gmail_service.sync_new_emails(service, "10", max_results=10)
+
+    assert len(message_ids) == 10
+    assert history_id == "101"
@@ -0,0 +1,140 @@
+import pytest
+
+import job_queue
+from job_queue import FAILED, PENDING, RUNNING, SUCCEEDED, JobQueue, backoff_delay, is_rate_limited
+from state_store import StateStore
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(job_queue, "time", clock)
+    # No jitter: every delay is the top of its range
+    monkeypatch.setattr(job_queue.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(job_queue, "JOB_BACKOFF_BASE", 30)
+    monkeypatch.setattr(job_queue, "JOB_BACKOFF_MAX", 3600)
+    monkeypatch.setattr(job_queue, "JOB_RATE_LIMIT_BACKOFF_FACTOR", 4)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    store = StateStore(str(tmp_path / "state.sqlite"))
+    yield JobQueue(store, max_attempts=3, lease_seconds=900)
+    store.close()
+
+
+def job_state(queue, email_id):
+    row = queue.db.execute(
+        "SELECT state, attempts, next_attempt_at FROM jobs WHERE email_id = ?", (email_id,)
+    ).fetchone()
+    return dict(zip(("state", "attempts", "next_attempt_at"), row))
+
+
+def test_enqueue_is_idempotent(queue):
+    assert queue.enqueue(["a", "b"]) == 2
+    assert queue.enqueue(["b", "c"]) == 1
+    assert queue.counts() == {PENDING: 3, RUNNING: 0, SUCCEEDED: 0, FAILED: 0}
+
+
+def test_claim_marks_running_and_respects_limit(queue, clock):
+    queue.enqueue(["a"])
+    clock.advance(1)
+    queue.enqueue(["b", "c"])
+    assert queue.claim(2) == ["a", "b"]
+    assert queue.claim(5) == ["c"]
+    assert queue.claim(5) == []
+    assert job_state(queue, "a")["state"] == RUNNING
+    assert job_state(queue, "a")["attempts"] == 1
+
+
+def test_complete(queue):
+    queue.enqueue(["a"])
+    queue.claim(1)
+    queue.complete("a")
+    assert job_state(queue, "a")["state"] == SUCCEEDED
+    assert queue.claim(1) == []
+
+
+def test_expired_lease_is_reclaimed(queue, clock):
+    queue.enqueue(["a"])
+    assert queue.claim(1) == ["a"]
+    clock.advance(899)
+    assert queue.claim(1) == []  # Worker still within its lease
+    clock.advance(2)
+    assert queue.claim(1) == ["a"]
+    assert job_state(queue, "a")["attempts"] == 2
+
+
+def test_failure_backs_off_exponentially(queue, clock):
+    queue.enqueue(["a"])
+    delays = []
+    for _ in range(2):
+        queue.claim(1)
+        assert queue.fail("a", "parse error") == PENDING
+        delays.append(job_state(queue, "a")["next_attempt_at"] - clock.now)
+        assert queue.claim(1) == []  # Not due before the backoff expires
+        clock.advance(delays[-1])
+    assert delays == [30, 60]
+
+
+def test_rate_limited_failure_waits_longer(queue, clock):
+    queue.enqueue(["a", "b"])
+    queue.claim(2)
+    queue.fail("a", "parse error")
+    queue.fail("b", "Error code: 429 - Too Many Requests")
+    assert job_state(queue, "a")["next_attempt_at"] - clock.now == 30
+    assert job_state(queue, "b")["next_attempt_at"] - clock.now == 120
+
+
+def test_dead_letter_after_max_attempts_and_retry(queue, clock):
+    queue.enqueue(["a"])
+    for attempt in range(1, 4):
+        assert queue.claim(1) == ["a"]
+        state = queue.fail("a", f"failure {attempt}")
+        clock.advance(3600)
+    assert state == FAILED
+    assert queue.claim(1) == []
+    [dead] = queue.dead_letters()
+    assert (dead["email_id"], dead["attempts"], dead["last_error"]) == ("a", 3, "failure 3")
+
+    assert queue.retry_dead_letters() == 1
+    assert queue.claim(1) == ["a"]
+    assert job_state(queue, "a")["attempts"] == 1
+
+
+@pytest.mark.parametrize("attempts, rate_limited, expected", [
+    (1, False, 30),
+    (2, False, 60),
+    (4, False, 240),
+    (10, False, 3600),  # capped at JOB_BACKOFF_MAX
+    (1, True, 120),
+    (7, True, 3600),
+])
+def test_backoff_delay(clock, attempts, rate_limited, expected):
+    assert backoff_delay(attempts, rate_limited) == expected
+
+
+@pytest.mark.parametrize("error, expected", [
+    ("Error code: 429 - Too Many Requests", True),
+    ("RateLimitError: rate limit reached for model", True),
+    ("Rate-limit exceeded", True),
+    ("Quota exceeded for quota metric", True),
+    ("RESOURCE_EXHAUSTED", True),
+    ("Connection reset by peer", False),
+    ("KeyError: 'classification'", False),
+    ("Invoice 14290 failed", False),
+])
+def test_is_rate_limited(error, expected):
+    assert is_rate_limited(error) is expected